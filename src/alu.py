@@ -0,0 +1,52 @@
+import functools
+from array import array
+
+# Lookup tables for ADC, SBC, the compares and the shifts, an alternative to
+# working out their results and flags with Python arithmetic. See
+# instructions.ALU_INSTRUCTIONS and CPU.set_alu_tables.
+#
+# Every entry packs the result byte in bits 0-7 and carry in bit 8. ADC
+# entries also hold overflow in bit 14, so that entry>>8 lines it up with V
+# in the P byte. N and Z come from the result byte like any other result.
+
+CARRY = 0x100
+OVERFLOW = 0x4000
+
+def _adc_entry(a, value, carry):
+    result = a + value + carry
+    entry = (result&0xFF) | (CARRY if (result > 0xFF) else 0)
+    if (~(a ^ value) & (a ^ result) & 0x80):
+        entry |= OVERFLOW
+    return entry
+
+def build_adc_table():
+    # Indexed by carry<<16 | A<<8 | operand, 128K 16-bit entries. SBC uses
+    # it with the operand inverted.
+    return array("H", (_adc_entry(a, value, carry) for carry in (0, 1) for a in range(256) for value in range(256)))
+
+def build_compare_table():
+    # Indexed by register<<8 | operand, the result is the difference.
+    return array("H", (((register - value)&0xFF) | (CARRY if (register >= value) else 0)
+                       for register in range(256) for value in range(256)))
+
+def build_shift_tables():
+    # ASL and LSR are indexed by the operand, ROL and ROR by carry<<8 | operand.
+    asl = array("H", (((value<<1)&0x1FF) for value in range(256)))
+    lsr = array("H", ((value>>1) | ((value&0x01)<<8) for value in range(256)))
+    rol = array("H", (((value<<1) | carry)&0x1FF for carry in (0, 1) for value in range(256)))
+    ror = array("H", ((value>>1) | (carry<<7) | ((value&0x01)<<8) for carry in (0, 1) for value in range(256)))
+    return asl, lsr, rol, ror
+
+@functools.lru_cache(maxsize=None)
+def build_tables():
+    # All tables by the names the table-driven instruction bodies use. Built
+    # on first use and shared from then on, around 400KB in all.
+    asl, lsr, rol, ror = build_shift_tables()
+    return {
+        "ADC_TABLE": build_adc_table(),
+        "COMPARE_TABLE": build_compare_table(),
+        "ASL_TABLE": asl,
+        "LSR_TABLE": lsr,
+        "ROL_TABLE": rol,
+        "ROR_TABLE": ror
+    }
@@ -0,0 +1,204 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from instructions import build_decoder_table
+from nes import NES
+from tracer import FIELDS, MemorySink, Tracer, format_differences, format_nestest, read_nestest_trace
+
+# nestest conformance and throughput benchmark. Runs nestest from $C000
+# (its automated mode) against nestest.log, then times untraced runs over
+# the instructions that conform. Results are appended to a JSON history and
+# compared against the previous run.
+# e.g. python benchmark.py roms/nestest.nes
+#      python benchmark.py --alu --no-save
+
+# Record fields checked for register conformance, everything but the cycle.
+REGISTER_FIELDS = range(FIELDS.index("CYC"))
+CYCLE_FIELD = FIELDS.index("CYC")
+
+NESTEST_START = 0xC000
+
+# ALU instructions timed by --alu, immediate or accumulator mode.
+ALU_OPCODES = {"ADC": 0x69, "SBC": 0xE9, "CMP": 0xC9, "CPX": 0xE0, "ASL": 0x0A, "LSR": 0x4A, "ROL": 0x2A, "ROR": 0x6A}
+
+def _new_emulator(rom, alu_tables=False):
+    emulator = NES()
+    emulator.load_cartridge(rom, verbose=False)
+    emulator.reset()
+    emulator.cpu._pc = NESTEST_START
+    if (alu_tables):
+        emulator.cpu.set_alu_tables(True)
+    return emulator
+
+def check_conformance(rom, log):
+    # Runs rom traced for as many instructions as the log has lines. Returns
+    # a dict with the number of leading lines whose registers match, the
+    # number whose registers and cycle counts match, and the first mismatch.
+    expected = list(read_nestest_trace(log))
+    emulator = _new_emulator(rom)
+    sink = MemorySink()
+    tracer = Tracer(sink)
+    emulator.cpu.set_tracer(tracer)
+
+    error = None
+    try:
+        emulator.run(instructions=len(expected))
+    except Exception as e:
+        error = repr(e)
+    tracer.close()
+    actual = sink.records
+
+    registers = cycles = None
+    for index, record in enumerate(expected):
+        if (index >= len(actual) or any(record[i] != actual[index][i] for i in REGISTER_FIELDS)):
+            registers = index
+            break
+        if (cycles is None and record[CYCLE_FIELD] != actual[index][CYCLE_FIELD]):
+            cycles = index
+    registers = len(expected) if registers is None else registers
+    cycles = registers if cycles is None else cycles
+
+    mismatch = None
+    if (registers < len(expected)):
+        mismatch = {
+            "line": registers + 1,
+            "expected": format_nestest(expected[registers]),
+            "actual": format_nestest(actual[registers]) if registers < len(actual) else error,
+            "fields": format_differences(expected[registers], actual[registers]) if registers < len(actual) else []
+        }
+    return {"lines": len(expected), "registers": registers, "cycles": cycles, "mismatch": mismatch}
+
+def measure_throughput(rom, instructions, repeat, alu_tables=False):
+    # Best of `repeat` untraced runs of `instructions` instructions.
+    best = None
+    for run in range(repeat):
+        result = _new_emulator(rom, alu_tables).run(instructions=instructions)
+        if (best is None or result.elapsed < best.elapsed):
+            best = result
+    return {
+        "instructions": best.instructions,
+        "cycles": best.cycles,
+        "instructions_per_second": best.instructions/best.elapsed,
+        "cycles_per_second": best.cycles/best.elapsed
+    }
+
+def measure_alu(repeat, rounds=200):
+    # Nanoseconds per instruction for each of ALU_OPCODES, computing the
+    # result and looking it up in the alu.py tables, best of `repeat`. Each
+    # round runs the handler once for every operand.
+    cpu = NES().cpu
+    cpu._a, cpu._x, cpu._y, cpu._carry, cpu._p, cpu._nz = 0x00, 0x00, 0x00, False, 0x04, 0x01
+    results = {}
+    for name, op_code in ALU_OPCODES.items():
+        timings = []
+        for alu_tables in (False, True):
+            decoder = build_decoder_table(alu_tables)[op_code]
+            handlers = [decoder(operand, 0) for operand in range(256)]*rounds
+            best = None
+            for run in range(repeat):
+                start_time = time.perf_counter()
+                for handler in handlers:
+                    handler(cpu)
+                elapsed = time.perf_counter() - start_time
+                best = elapsed if (best is None) else min(best, elapsed)
+            timings.append(best*1e9/len(handlers))
+        results[name] = {"arithmetic": timings[0], "tables": timings[1]}
+    return results
+
+def _git_revision():
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+def load_history(filename):
+    if (not os.path.exists(filename)):
+        return []
+    with open(filename) as file:
+        return json.load(file)
+
+def save_history(filename, history):
+    with open(filename, "w") as file:
+        json.dump(history, file, indent=2)
+        file.write("\n")
+
+def find_regressions(previous, current, threshold):
+    # Returns descriptions of what got worse since `previous`. Throughput has
+    # to drop by more than `threshold` (a fraction) to count.
+    regressions = []
+    for key in ("registers", "cycles"):
+        if (current["conformance"][key] < previous["conformance"][key]):
+            regressions.append(f"{key} conformance dropped from {previous['conformance'][key]} "
+                               f"to {current['conformance'][key]} lines")
+    for key in ("instructions_per_second", "cycles_per_second"):
+        before = previous["throughput"][key]
+        after = current["throughput"][key]
+        if (after < before*(1 - threshold)):
+            regressions.append(f"{key.replace('_', ' ')} dropped {100*(before - after)/before:.1f}% "
+                               f"({before:,.0f} -> {after:,.0f})")
+    return regressions
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Check nestest conformance and measure emulation throughput.")
+    parser.add_argument("rom", nargs="?", default=os.path.join(here, "roms", "nestest.nes"), help="path to nestest.nes")
+    parser.add_argument("--log", default=os.path.join(here, "roms", "nestest.log.txt"), help="reference nestest.log")
+    parser.add_argument("--history", default="benchmark_history.json", help="JSON file results are appended to")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs, the fastest is kept")
+    parser.add_argument("--threshold", type=float, default=0.10, help="throughput drop counted as a regression (fraction)")
+    parser.add_argument("--no-save", action="store_true", help="don't append this run to the history")
+    parser.add_argument("--alu", action="store_true", help="also compare the ALU lookup tables with computing results")
+    args = parser.parse_args(argv)
+
+    conformance = check_conformance(args.rom, args.log)
+    print(f"Registers: {conformance['registers']}/{conformance['lines']} lines")
+    print(f"Cycles:    {conformance['cycles']}/{conformance['lines']} lines")
+    if (conformance["mismatch"] is not None):
+        mismatch = conformance["mismatch"]
+        print(f"First mismatch at line {mismatch['line']}:")
+        print(f"  - {mismatch['expected']}")
+        print(f"  + {mismatch['actual']}")
+        if (mismatch["fields"]):
+            print(f"Fields (expected/actual): {', '.join(mismatch['fields'])}")
+
+    if (conformance["registers"] == 0):
+        print("Nothing conforms, skipping throughput")
+        return 1
+    throughput = measure_throughput(args.rom, conformance["registers"], args.repeat)
+    print(f"Throughput: {throughput['instructions_per_second']:,.0f} instructions/s, "
+          f"{throughput['cycles_per_second']:,.0f} cycles/s")
+
+    if (args.alu):
+        tables = measure_throughput(args.rom, conformance["registers"], args.repeat, alu_tables=True)
+        print(f"With ALU tables: {tables['instructions_per_second']:,.0f} instructions/s, "
+              f"{tables['cycles_per_second']:,.0f} cycles/s")
+        print("Instruction  Arithmetic  Tables")
+        for name, timing in measure_alu(args.repeat).items():
+            print(f"{name:11}  {timing['arithmetic']:8.1f}ns  {timing['tables']:5.1f}ns "
+                  f"({timing['arithmetic']/timing['tables']:.2f}x)")
+
+    result = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "conformance": conformance,
+        "throughput": throughput
+    }
+    history = load_history(args.history)
+    regressions = find_regressions(history[-1], result, args.threshold) if history else []
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    if (not args.no_save):
+        history.append(result)
+        save_history(args.history, history)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,42 @@
+import mmap
+import os
+import weakref
+
+# ROM images mapped by this process. Every cartridge loaded from the same
+# file shares one read-only mapping, and the OS shares its pages with other
+# processes mapping the same file.
+_rom_images = weakref.WeakValueDictionary()
+
+def load_rom_image(filename):
+    path = os.path.realpath(filename)
+    stat = os.stat(path)
+    if (stat.st_size < 16):
+        raise RuntimeError("Not a valid NES ROM!")
+
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    image = _rom_images.get(key)
+    if (image is None):
+        with open(path, "rb") as file:
+            image = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        _rom_images[key] = image
+    return image
+
+
 class Cartridge:
-    def __init__(self, filename):
+    __slots__ = (
+        "_filename", "_rom", "_total_program_rom_pages", "_total_character_rom_pages", "_mapper_number",
+        "_four_screen_mode", "_trainer", "_has_battery", "_mirroring", "_nes_2_Format", "_program_rom_size",
+        "_character_rom_size", "_mapper"
+    )
+
+    def __init__(self, filename, verbose=True):
         self._filename = filename
 
-        # Load ROM data from file.
-        self._rom = open(filename, "rb").read()
+        # Map ROM data from file, banks are zero-copy views into it.
+        self._rom = memoryview(load_rom_image(filename))
         
         # Check first 3 bytes for the letters 'NES'
-        if (self._rom[0:3].decode('utf-8') != "NES"):
+        if (bytes(self._rom[0:3]) != b"NES"):
             raise RuntimeError("Not a valid NES ROM!")            
 
         # Number of 16k program ROM pages.
@@ -46,14 +76,15 @@ class Cartridge:
         else:
             raise RuntimeError(f"No mapper found for ID {self._mapper_number}")
 
-        print(f"File loaded {filename}")
-        print(f"Program ROM pages: {self._total_program_rom_pages}")
-        print(f"Character ROM pages: {self._total_character_rom_pages}")
-        print(f"Mapper #: {self._mapper_number}")
-        print(f"Four screen mode: {self._four_screen_mode}")
-        print(f"Trainer: {self._trainer}")
-        print(f"Has battery: {self._has_battery}")
-        print(f"Mirroring: {self._mirroring}")
+        if (verbose):
+            print(f"File loaded {filename}")
+            print(f"Program ROM pages: {self._total_program_rom_pages}")
+            print(f"Character ROM pages: {self._total_character_rom_pages}")
+            print(f"Mapper #: {self._mapper_number}")
+            print(f"Four screen mode: {self._four_screen_mode}")
+            print(f"Trainer: {self._trainer}")
+            print(f"Has battery: {self._has_battery}")
+            print(f"Mirroring: {self._mirroring}")
 
     def read_byte(self, address):
         return self._mapper.read_byte(address)
@@ -61,11 +92,22 @@ class Cartridge:
     def write_byte(self, address, byte):
         raise NotImplementedError()
 
+    def map_pages(self, mmu):
+        self._mapper.map_pages(mmu)
+
+    def map_pattern_tables(self, ppu):
+        self._mapper.map_pattern_tables(ppu)
+
+    def map_nametables(self, ppu):
+        self._mapper.map_nametables(ppu)
+
 
 ###############################################################################
 # Mapper base 
 ###############################################################################
 class Mapper:
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -75,6 +117,24 @@ class Mapper:
     def write_byte(self, address, byte):
         raise NotImplementedError()
 
+    # Maps memory backed banks straight into the MMU page table. Mappers call
+    # this again with new banks when they switch. By default everything goes
+    # through read_byte/write_byte.
+    def map_pages(self, mmu):
+        pass
+
+    # Maps the active CHR bank into the PPU's pattern tables, called again
+    # with new banks when the mapper switches. The PPU keeps recently mapped
+    # banks decoded by identity, so switch between the same bank objects
+    # rather than fresh slices.
+    def map_pattern_tables(self, ppu):
+        pass
+
+    # Sets the PPU's nametable mirroring, called again when the mapper
+    # switches it.
+    def map_nametables(self, ppu):
+        pass
+
 
 ###############################################################################
 # iNES Mapper ID: 0
@@ -91,19 +151,51 @@ class Mapper:
 # Audio: No
 ###############################################################################
 class NROM(Mapper):
+    __slots__ = ("_rom", "_cartridge", "_prog_rom_banks", "_char_rom_banks", "_prog_ram_banks")
+
     def __init__(self, cartridge, rom):
         self._rom = rom
         self._cartridge = cartridge
 
-        # Slice ROM into banks.
+        # Slice ROM into banks, these are views into the ROM image, not copies.
         rom_offset = 528 if self._cartridge._trainer else 16
-        self._prog_rom_banks = [0xFF] * self._cartridge._total_program_rom_pages
+        self._prog_rom_banks = []
+        for bank in range(self._cartridge._total_program_rom_pages):
+            start = rom_offset + (16384 * bank)
+            self._prog_rom_banks.append(self._rom[start:start+16384])
 
-        for bank in (0, self._cartridge._total_program_rom_pages-1):
-            self._prog_rom_banks[bank] = self._rom[rom_offset + (16384 * bank):]
+        chr_offset = rom_offset + (16384 * self._cartridge._total_program_rom_pages)
+        self._char_rom_banks = []
+        for bank in range(self._cartridge._total_character_rom_pages):
+            start = chr_offset + (8192 * bank)
+            self._char_rom_banks.append(self._rom[start:start+8192])
+
+        # Boards without CHR ROM have 8KB of CHR RAM instead.
+        if (len(self._char_rom_banks) == 0):
+            self._char_rom_banks.append(bytearray(8192))
 
         self._prog_ram_banks = []
 
+    def map_pages(self, mmu):
+        # First 16KB of ROM.
+        mmu.map_memory(0x80, 0x40, self._prog_rom_banks[0], writable=False)
+
+        # Last 16KB of ROM, if there's only one page 16K of ROM, mirror bank 0 here.
+        last_bank = 0 if self._cartridge._total_program_rom_pages == 1 else 1
+        mmu.map_memory(0xC0, 0x40, self._prog_rom_banks[last_bank], writable=False)
+
+    def map_pattern_tables(self, ppu):
+        ppu.map_pattern_tables(self._char_rom_banks[0])
+
+    def map_nametables(self, ppu):
+        # Fixed by the board, from the header.
+        if (self._cartridge._four_screen_mode):
+            ppu.map_nametables(ppu.FOUR_SCREEN)
+        elif (self._cartridge._mirroring):
+            ppu.map_nametables(ppu.VERTICAL_MIRRORING)
+        else:
+            ppu.map_nametables(ppu.HORIZONTAL_MIRRORING)
+
     def read_byte(self, address):
         # Family Basic only: PRG RAM, mirrored as necessary to fill entire 8KB window, write protectable with external switch.
         if (address >= 0x6000 and address <= 0x7FFF):
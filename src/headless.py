@@ -0,0 +1,57 @@
+import argparse
+import sys
+import time
+from nes import NES, RunResult
+from tracer import Tracer, SINKS
+from renderer import BACKENDS
+
+# Command line entry point for running a ROM without pygame or PyQt.
+# e.g. python headless.py roms/nestest.nes --pc C000 --instructions 5003
+
+def parse_address(value):
+    return int(value, 16)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an NES ROM headless for a fixed budget.")
+    parser.add_argument("rom", help="path to an iNES ROM")
+    parser.add_argument("--frames", type=int, help="stop after this many PPU frames")
+    parser.add_argument("--cycles", type=int, help="stop after this many CPU cycles")
+    parser.add_argument("--instructions", type=int, help="stop after this many CPU instructions")
+    parser.add_argument("--pc", type=parse_address, help="start execution here (hex) instead of the reset vector")
+    parser.add_argument("--trace", metavar="FILE", help="write an execution trace, compressed if FILE ends in .gz or .xz")
+    parser.add_argument("--trace-format", choices=sorted(SINKS), default="nestest", help="trace format (default: nestest)")
+    parser.add_argument("--trace-ring", type=int, metavar="N", help="only keep the last N instructions of the trace")
+    parser.add_argument("--renderer", choices=sorted(BACKENDS), help="renderer backend (default: numpy if installed)")
+    args = parser.parse_args(argv)
+
+    if (args.frames is None and args.cycles is None and args.instructions is None):
+        parser.error("at least one of --frames, --cycles or --instructions is required")
+
+    emulator = NES()
+    emulator.load_cartridge(args.rom)
+    emulator.reset()
+    if (args.renderer is not None):
+        emulator.ppu.set_renderer(args.renderer)
+    if (args.pc is not None):
+        emulator.cpu._pc = args.pc
+
+    tracer = None
+    if (args.trace is not None):
+        tracer = Tracer(SINKS[args.trace_format](args.trace), ring=args.trace_ring)
+        emulator.cpu.set_tracer(tracer)
+
+    start_time = time.perf_counter()
+    try:
+        result = emulator.run(frames=args.frames, cycles=args.cycles, instructions=args.instructions)
+    except Exception as e:
+        result = getattr(e, "result", None)
+        if (result is None):
+            result = RunResult("error", 0, 0, 0, time.perf_counter() - start_time, repr(e))
+    finally:
+        if (tracer is not None):
+            tracer.close()
+    print(result)
+    return 1 if (result.reason == "error") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,955 @@
+import textwrap
+import alu
+
+###############################################################################
+# Addressing Modes
+###############################################################################
+IMPLIED     = "implied"
+ACCUMULATOR = "accumulator"
+IMMEDIATE   = "immediate"
+ZEROPAGE    = "zeropage"
+ZEROPAGE_X  = "zeropage,X"
+ZEROPAGE_Y  = "zeropage,Y"
+ABSOLUTE    = "absolute"
+ABSOLUTE_X  = "absolute,X"
+ABSOLUTE_Y  = "absolute,Y"
+INDIRECT    = "indirect"
+INDIRECT_X  = "(indirect,X)"
+INDIRECT_Y  = "(indirect),Y"
+RELATIVE    = "relative"
+
+# Number of bytes taken by an instruction in each addressing mode, op code included.
+INSTRUCTION_SIZE = {
+    IMPLIED: 1, ACCUMULATOR: 1, IMMEDIATE: 2, RELATIVE: 2,
+    ZEROPAGE: 2, ZEROPAGE_X: 2, ZEROPAGE_Y: 2, INDIRECT_X: 2, INDIRECT_Y: 2,
+    ABSOLUTE: 3, ABSOLUTE_X: 3, ABSOLUTE_Y: 3, INDIRECT: 3
+}
+
+# Source that reads the instruction's operand bytes into `operand`. Fetches
+# come straight from the CPU's cached view of the code region and only fall
+# back to the MMU when PC leaves it, including when it wraps from $FFFF to
+# $0000.
+OPERAND_FETCH = {
+    1: """
+        pc = self._pc
+        if (self._code_start <= pc < self._code_end):
+            operand = self._code[pc + self._code_offset]
+        else:
+            operand = self._fetch_byte(pc)
+        self._pc = (pc + 1)&0xFFFF
+    """,
+    2: """
+        pc = self._pc
+        if (self._code_start <= pc and pc + 1 < self._code_end):
+            index = pc + self._code_offset
+            operand = self._code[index] + (self._code[index+1]<<8)
+        else:
+            operand = self._fetch_byte(pc) + (self._fetch_byte((pc + 1)&0xFFFF)<<8)
+        self._pc = (pc + 2)&0xFFFF
+    """
+}
+
+# Source that leaves the effective address in `address`.
+ADDRESSING_MODES = {
+    ZEROPAGE: """
+        address = operand
+    """,
+    ZEROPAGE_X: """
+        address = (operand + self._x)&0xFF
+    """,
+    ZEROPAGE_Y: """
+        address = (operand + self._y)&0xFF
+    """,
+    ABSOLUTE: """
+        address = operand
+    """,
+    ABSOLUTE_X: """
+        address = (operand + self._x)&0xFFFF
+    """,
+    ABSOLUTE_Y: """
+        address = (operand + self._y)&0xFFFF
+    """,
+    INDIRECT: """
+        # The pointer's high byte is fetched without carrying into the page.
+        address = (self._read_byte((operand&0xFF00) | ((operand+1)&0xFF))<<8) + self._read_byte(operand)
+    """,
+    INDIRECT_X: """
+        pointer = (operand + self._x)&0xFF
+        address = (self._read_byte((pointer+1)&0xFF)<<8) + self._read_byte(pointer)
+    """,
+    INDIRECT_Y: """
+        address = ((self._read_byte((operand+1)&0xFF)<<8) + self._read_byte(operand) + self._y)&0xFFFF
+    """
+}
+
+# Indexed modes that take a cycle more for reads when indexing crosses into
+# the next page. Source that leaves the effective address in `address` and
+# the extra cycle (0 or 1) in `crossed`, taken from the carry out of the low
+# byte.
+PAGE_CROSSING_MODES = {
+    ABSOLUTE_X: """
+        crossed = ((operand&0xFF) + self._x)>>8
+        address = (operand + self._x)&0xFFFF
+    """,
+    ABSOLUTE_Y: """
+        crossed = ((operand&0xFF) + self._y)>>8
+        address = (operand + self._y)&0xFFFF
+    """,
+    INDIRECT_Y: """
+        base = (self._read_byte((operand+1)&0xFF)<<8) + self._read_byte(operand)
+        crossed = ((base&0xFF) + self._y)>>8
+        address = (base + self._y)&0xFFFF
+    """
+}
+
+###############################################################################
+# Operand Kinds
+# READ    - Instruction body uses the operand `value`.
+# ADDRESS - Instruction body uses the effective `address` only.
+# MODIFY  - Instruction body rewrites `value`, which is stored back to the
+#           accumulator or memory.
+# BRANCH  - Instruction body is the condition for taking the branch.
+# NONE    - Instruction has no operand.
+###############################################################################
+READ    = "read"
+ADDRESS = "address"
+MODIFY  = "modify"
+BRANCH  = "branch"
+NONE    = "none"
+
+###############################################################################
+# Instructions
+# N and Z are set by storing the result they come from in self._nz, V, D and
+# I live in the packed self._p, see CPU.reset.
+###############################################################################
+INSTRUCTIONS = {
+    # Add Memory to Accumulator with Carry
+    # A + M + C -> A, C                N Z C I D V
+    #                                  + + + - - +
+    "ADC": (READ, """
+        result = self._a + value + self._carry
+        self._carry = result > 0xFF
+        # More info on source: https://stackoverflow.com/a/29224684
+        self._p = (self._p&0xBF) | ((~(self._a ^ value) & (self._a ^ result) & 0x80)>>1)
+        self._a = result&0xFF
+        self._nz = self._a
+    """),
+
+    # AND Memory with Accumulator
+    # A AND M -> A                     N Z C I D V
+    #                                  + + - - - -
+    "AND": (READ, """
+        self._a &= value
+        self._nz = self._a
+    """),
+
+    # Shift Left One Bit (Memory or Accumulator)
+    # C <- [76543210] <- 0             N Z C I D V
+    #                                  + + + - - -
+    "ASL": (MODIFY, """
+        self._carry = value > 0x7F
+        value = (value<<1)&0xFF
+        self._nz = value
+    """),
+
+    # Branch on Carry Clear
+    # branch on C = 0                  N Z C I D V
+    #                                  - - - - - -
+    "BCC": (BRANCH, "not self._carry"),
+
+    # Branch on Carry Set
+    # branch on C = 1                  N Z C I D V
+    #                                  - - - - - -
+    "BCS": (BRANCH, "self._carry"),
+
+    # Branch on Result Zero
+    # branch on Z = 1                  N Z C I D V
+    #                                  - - - - - -
+    "BEQ": (BRANCH, "not self._nz&0xFF"),
+
+    # Test Bits in Memory with Accumulator
+    # bits 7 and 6 of operand are transfered to bit 7 and 6 of SR (N,V);
+    # the zeroflag is set to the result of operand AND accumulator.
+    # A AND M, M7 -> N, M6 -> V        N Z C I D V
+    #                                 M7 + - - - M6
+    "BIT": (READ, """
+        self._nz = ((value&0x80)<<2) | (value&self._a)
+        self._p = (self._p&0xBF) | (value&0x40)
+    """),
+
+    # Branch on Result Minus
+    # branch on N = 1                  N Z C I D V
+    #                                  - - - - - -
+    "BMI": (BRANCH, "self._nz&0x280"),
+
+    # Branch on Result not Zero
+    # branch on Z = 0                  N Z C I D V
+    #                                  - - - - - -
+    "BNE": (BRANCH, "self._nz&0xFF"),
+
+    # Branch on Result Plus
+    # branch on N = 0                  N Z C I D V
+    #                                  - - - - - -
+    "BPL": (BRANCH, "not self._nz&0x280"),
+
+    # Force Break
+    # interrupt,                       N Z C I D V
+    # push PC+2, push SR               - - - 1 - -
+    "BRK": (NONE, """
+        return_address = (self._pc + 1)&0xFFFF
+        self.push(return_address>>8)
+        self.push(return_address&0xFF)
+        self.push(self._get_status_flag() | 0x30) # Bits 5 and 4 are set when pushed by BRK
+        self._p |= 0x04
+        self._pc = self._read_byte(self.VECTOR_IRQ) + (self._read_byte(self.VECTOR_IRQ+1)<<8)
+    """),
+
+    # Branch on Overflow Clear
+    # branch on V = 0                  N Z C I D V
+    #                                  - - - - - -
+    "BVC": (BRANCH, "not self._p&0x40"),
+
+    # Branch on Overflow Set
+    # branch on V = 1                  N Z C I D V
+    #                                  - - - - - -
+    "BVS": (BRANCH, "self._p&0x40"),
+
+    # Clear Carry Flag
+    # 0 -> C                           N Z C I D V
+    #                                  - - 0 - - -
+    "CLC": (NONE, """
+        self._carry = False
+    """),
+
+    # Clear Decimal Mode
+    # 0 -> D                           N Z C I D V
+    #                                  - - - - 0 -
+    "CLD": (NONE, """
+        self._p &= ~0x08
+    """),
+
+    # Clear Interrupt Disable Bit
+    # 0 -> I                           N Z C I D V
+    #                                  - - - 0 - -
+    "CLI": (NONE, """
+        self._p &= ~0x04
+    """),
+
+    # Clear Overflow Flag
+    # 0 -> V                           N Z C I D V
+    #                                  - - - - - 0
+    "CLV": (NONE, """
+        self._p &= ~0x40
+    """),
+
+    # Compare Memory with Accumulator
+    # A - M                            N Z C I D V
+    #                                  + + + - - -
+    "CMP": (READ, """
+        self._carry = self._a >= value
+        self._nz = (self._a - value)&0xFF
+    """),
+
+    # Compare Memory and Index X
+    # X - M                            N Z C I D V
+    #                                  + + + - - -
+    "CPX": (READ, """
+        self._carry = self._x >= value
+        self._nz = (self._x - value)&0xFF
+    """),
+
+    # Compare Memory and Index Y
+    # Y - M                            N Z C I D V
+    #                                  + + + - - -
+    "CPY": (READ, """
+        self._carry = self._y >= value
+        self._nz = (self._y - value)&0xFF
+    """),
+
+    # Decrement Memory by One
+    # M - 1 -> M                       N Z C I D V
+    #                                  + + - - - -
+    "DEC": (MODIFY, """
+        value = (value - 1)&0xFF
+        self._nz = value
+    """),
+
+    # Decrement Index X by One
+    # X - 1 -> X                       N Z C I D V
+    #                                  + + - - - -
+    "DEX": (NONE, """
+        self._x = (self._x - 1)&0xFF
+        self._nz = self._x
+    """),
+
+    # Decrement Index Y by One
+    # Y - 1 -> Y                       N Z C I D V
+    #                                  + + - - - -
+    "DEY": (NONE, """
+        self._y = (self._y - 1)&0xFF
+        self._nz = self._y
+    """),
+
+    # Exclusive-OR Memory with Accumulator
+    # A EOR M -> A                     N Z C I D V
+    #                                  + + - - - -
+    "EOR": (READ, """
+        self._a ^= value
+        self._nz = self._a
+    """),
+
+    # Increment Memory by One
+    # M + 1 -> M                       N Z C I D V
+    #                                  + + - - - -
+    "INC": (MODIFY, """
+        value = (value + 1)&0xFF
+        self._nz = value
+    """),
+
+    # Increment Index X by One
+    # X + 1 -> X                       N Z C I D V
+    #                                  + + - - - -
+    "INX": (NONE, """
+        self._x = (self._x + 1)&0xFF
+        self._nz = self._x
+    """),
+
+    # Increment Index Y by One
+    # Y + 1 -> Y                       N Z C I D V
+    #                                  + + - - - -
+    "INY": (NONE, """
+        self._y = (self._y + 1)&0xFF
+        self._nz = self._y
+    """),
+
+    # Jump to New Location
+    # (PC+1) -> PCL                    N Z C I D V
+    # (PC+2) -> PCH                    - - - - - -
+    "JMP": (ADDRESS, """
+        self._pc = address
+    """),
+
+    # Jump to New Location Saving Return Address
+    # push (PC+2),                     N Z C I D V
+    # (PC+1) -> PCL                    - - - - - -
+    # (PC+2) -> PCH
+    "JSR": (ADDRESS, """
+        return_address = (self._pc - 1)&0xFFFF
+        self.push(return_address>>8)
+        self.push(return_address&0xFF)
+        self._pc = address
+    """),
+
+    # Load Accumulator with Memory
+    # M -> A                           N Z C I D V
+    #                                  + + - - - -
+    "LDA": (READ, """
+        self._a = value
+        self._nz = value
+    """),
+
+    # Load Index X with Memory
+    # M -> X                           N Z C I D V
+    #                                  + + - - - -
+    "LDX": (READ, """
+        self._x = value
+        self._nz = value
+    """),
+
+    # Load Index Y with Memory
+    # M -> Y                           N Z C I D V
+    #                                  + + - - - -
+    "LDY": (READ, """
+        self._y = value
+        self._nz = value
+    """),
+
+    # Shift One Bit Right (Memory or Accumulator)
+    # 0 -> [76543210] -> C             N Z C I D V
+    #                                  - + + - - -
+    "LSR": (MODIFY, """
+        self._carry = value&0x01 > 0
+        value >>= 1
+        self._nz = value
+    """),
+
+    # No Operation
+    # ---                              N Z C I D V
+    #                                  - - - - - -
+    "NOP": (NONE, """
+        pass
+    """),
+
+    # OR Memory with Accumulator
+    # A OR M -> A                      N Z C I D V
+    #                                  + + - - - -
+    "ORA": (READ, """
+        self._a |= value
+        self._nz = self._a
+    """),
+
+    # Push Accumulator on Stack
+    # push A                           N Z C I D V
+    #                                  - - - - - -
+    "PHA": (NONE, """
+        self.push(self._a)
+    """),
+
+    # Push Processor Status on Stack
+    # push SR                          N Z C I D V
+    #                                  - - - - - -
+    "PHP": (NONE, """
+        self.push(self._get_status_flag() | 0x30) # Bits 5 and 4 are set when pushed by PHP
+    """),
+
+    # Pull Accumulator from Stack
+    # pull A                           N Z C I D V
+    #                                  + + - - - -
+    "PLA": (NONE, """
+        self._a = self.pull()
+        self._nz = self._a
+    """),
+
+    # Pull Processor Status from Stack
+    # pull SR                          N Z C I D V
+    #                                  from stack
+    "PLP": (NONE, """
+        self._set_status_flag(self.pull())
+    """),
+
+    # Rotate One Bit Left (Memory or Accumulator)
+    # C <- [76543210] <- C             N Z C I D V
+    #                                  + + + - - -
+    "ROL": (MODIFY, """
+        carry_out = value > 0x7F
+        value = ((value<<1) + self._carry)&0xFF
+        self._carry = carry_out
+        self._nz = value
+    """),
+
+    # Rotate One Bit Right (Memory or Accumulator)
+    # C -> [76543210] -> C             N Z C I D V
+    #                                  + + + - - -
+    "ROR": (MODIFY, """
+        carry_out = value&0x01 > 0
+        value = (value>>1) + (0x80 if self._carry else 0)
+        self._carry = carry_out
+        self._nz = value
+    """),
+
+    # Return from Interrupt
+    # pull SR, pull PC                 N Z C I D V
+    #                                  from stack
+    "RTI": (NONE, """
+        self._set_status_flag(self.pull())
+        pc_lo = self.pull()
+        pc_hi = self.pull()
+        self._pc = (pc_hi<<8) + pc_lo
+    """),
+
+    # Return from Subroutine
+    # pull PC, PC+1 -> PC              N Z C I D V
+    #                                  - - - - - -
+    "RTS": (NONE, """
+        pc_lo = self.pull()
+        pc_hi = self.pull()
+        self._pc = ((pc_hi<<8) + pc_lo + 1)&0xFFFF
+    """),
+
+    # Subtract Memory from Accumulator with Borrow
+    # A - M - C -> A                   N Z C I D V
+    #                                  + + + - - +
+    "SBC": (READ, """
+        # Invert value and run through same logic as ADC.
+        value ^= 0xFF
+        result = self._a + value + self._carry
+        self._carry = result > 0xFF
+        self._p = (self._p&0xBF) | ((~(self._a ^ value) & (self._a ^ result) & 0x80)>>1)
+        self._a = result&0xFF
+        self._nz = self._a
+    """),
+
+    # Set Carry Flag
+    # 1 -> C                           N Z C I D V
+    #                                  - - 1 - - -
+    "SEC": (NONE, """
+        self._carry = True
+    """),
+
+    # Set Decimal Flag
+    # 1 -> D                           N Z C I D V
+    #                                  - - - - 1 -
+    "SED": (NONE, """
+        self._p |= 0x08
+    """),
+
+    # Set Interrupt Disable Status
+    # 1 -> I                           N Z C I D V
+    #                                  - - - 1 - -
+    "SEI": (NONE, """
+        self._p |= 0x04
+    """),
+
+    # Store Accumulator in Memory
+    # A -> M                           N Z C I D V
+    #                                  - - - - - -
+    "STA": (ADDRESS, """
+        self._write_byte(address, self._a)
+    """),
+
+    # Store Index X in Memory
+    # X -> M                           N Z C I D V
+    #                                  - - - - - -
+    "STX": (ADDRESS, """
+        self._write_byte(address, self._x)
+    """),
+
+    # Store Index Y in Memory
+    # Y -> M                           N Z C I D V
+    #                                  - - - - - -
+    "STY": (ADDRESS, """
+        self._write_byte(address, self._y)
+    """),
+
+    # Transfer Accumulator to Index X
+    # A -> X                           N Z C I D V
+    #                                  + + - - - -
+    "TAX": (NONE, """
+        self._x = self._a
+        self._nz = self._x
+    """),
+
+    # Transfer Accumulator to Index Y
+    # A -> Y                           N Z C I D V
+    #                                  + + - - - -
+    "TAY": (NONE, """
+        self._y = self._a
+        self._nz = self._y
+    """),
+
+    # Transfer Stack Pointer to Index X
+    # SP -> X                          N Z C I D V
+    #                                  + + - - - -
+    "TSX": (NONE, """
+        self._x = self._sp
+        self._nz = self._x
+    """),
+
+    # Transfer Index X to Accumulator
+    # X -> A                           N Z C I D V
+    #                                  + + - - - -
+    "TXA": (NONE, """
+        self._a = self._x
+        self._nz = self._a
+    """),
+
+    # Transfer Index X to Stack Register
+    # X -> SP                          N Z C I D V
+    #                                  - - - - - -
+    "TXS": (NONE, """
+        self._sp = self._x
+    """),
+
+    # Transfer Index Y to Accumulator
+    # Y -> A                           N Z C I D V
+    #                                  + + - - - -
+    "TYA": (NONE, """
+        self._a = self._y
+        self._nz = self._a
+    """)
+}
+
+# Bodies of the ALU instructions that look their results and flags up in the
+# tables from alu.py instead of computing them. Handlers built with
+# alu_tables=True use these.
+ALU_INSTRUCTIONS = {
+    "ADC": (READ, """
+        entry = ADC_TABLE[(self._carry<<16) | (self._a<<8) | value]
+        self._a = self._nz = entry&0xFF
+        self._carry = entry&0x100 > 0
+        self._p = (self._p&0xBF) | ((entry>>8)&0x40)
+    """),
+
+    "SBC": (READ, """
+        entry = ADC_TABLE[(self._carry<<16) | (self._a<<8) | (value ^ 0xFF)]
+        self._a = self._nz = entry&0xFF
+        self._carry = entry&0x100 > 0
+        self._p = (self._p&0xBF) | ((entry>>8)&0x40)
+    """),
+
+    "CMP": (READ, """
+        entry = COMPARE_TABLE[(self._a<<8) | value]
+        self._nz = entry&0xFF
+        self._carry = entry > 0xFF
+    """),
+
+    "CPX": (READ, """
+        entry = COMPARE_TABLE[(self._x<<8) | value]
+        self._nz = entry&0xFF
+        self._carry = entry > 0xFF
+    """),
+
+    "CPY": (READ, """
+        entry = COMPARE_TABLE[(self._y<<8) | value]
+        self._nz = entry&0xFF
+        self._carry = entry > 0xFF
+    """),
+
+    "ASL": (MODIFY, """
+        entry = ASL_TABLE[value]
+        value = self._nz = entry&0xFF
+        self._carry = entry > 0xFF
+    """),
+
+    "LSR": (MODIFY, """
+        entry = LSR_TABLE[value]
+        value = self._nz = entry&0xFF
+        self._carry = entry > 0xFF
+    """),
+
+    "ROL": (MODIFY, """
+        entry = ROL_TABLE[(self._carry<<8) | value]
+        value = self._nz = entry&0xFF
+        self._carry = entry > 0xFF
+    """),
+
+    "ROR": (MODIFY, """
+        entry = ROR_TABLE[(self._carry<<8) | value]
+        value = self._nz = entry&0xFF
+        self._carry = entry > 0xFF
+    """)
+}
+
+###############################################################################
+# Op Code Table
+# op code: (instruction, addressing mode, cycles)
+###############################################################################
+OPCODES = {
+    0x69: ("ADC", IMMEDIATE,   2),
+    0x65: ("ADC", ZEROPAGE,    3),
+    0x75: ("ADC", ZEROPAGE_X,  4),
+    0x6D: ("ADC", ABSOLUTE,    4),
+    0x7D: ("ADC", ABSOLUTE_X,  4),
+    0x79: ("ADC", ABSOLUTE_Y,  4),
+    0x61: ("ADC", INDIRECT_X,  6),
+    0x71: ("ADC", INDIRECT_Y,  5),
+
+    0x29: ("AND", IMMEDIATE,   2),
+    0x25: ("AND", ZEROPAGE,    3),
+    0x35: ("AND", ZEROPAGE_X,  4),
+    0x2D: ("AND", ABSOLUTE,    4),
+    0x3D: ("AND", ABSOLUTE_X,  4),
+    0x39: ("AND", ABSOLUTE_Y,  4),
+    0x21: ("AND", INDIRECT_X,  6),
+    0x31: ("AND", INDIRECT_Y,  5),
+
+    0x0A: ("ASL", ACCUMULATOR, 2),
+    0x06: ("ASL", ZEROPAGE,    5),
+    0x16: ("ASL", ZEROPAGE_X,  6),
+    0x0E: ("ASL", ABSOLUTE,    6),
+    0x1E: ("ASL", ABSOLUTE_X,  7),
+
+    0x90: ("BCC", RELATIVE,    2),
+    0xB0: ("BCS", RELATIVE,    2),
+    0xF0: ("BEQ", RELATIVE,    2),
+
+    0x24: ("BIT", ZEROPAGE,    3),
+    0x2C: ("BIT", ABSOLUTE,    4),
+
+    0x30: ("BMI", RELATIVE,    2),
+    0xD0: ("BNE", RELATIVE,    2),
+    0x10: ("BPL", RELATIVE,    2),
+    0x00: ("BRK", IMPLIED,     7),
+    0x50: ("BVC", RELATIVE,    2),
+    0x70: ("BVS", RELATIVE,    2),
+
+    0x18: ("CLC", IMPLIED,     2),
+    0xD8: ("CLD", IMPLIED,     2),
+    0x58: ("CLI", IMPLIED,     2),
+    0xB8: ("CLV", IMPLIED,     2),
+
+    0xC9: ("CMP", IMMEDIATE,   2),
+    0xC5: ("CMP", ZEROPAGE,    3),
+    0xD5: ("CMP", ZEROPAGE_X,  4),
+    0xCD: ("CMP", ABSOLUTE,    4),
+    0xDD: ("CMP", ABSOLUTE_X,  4),
+    0xD9: ("CMP", ABSOLUTE_Y,  4),
+    0xC1: ("CMP", INDIRECT_X,  6),
+    0xD1: ("CMP", INDIRECT_Y,  5),
+
+    0xE0: ("CPX", IMMEDIATE,   2),
+    0xE4: ("CPX", ZEROPAGE,    3),
+    0xEC: ("CPX", ABSOLUTE,    4),
+
+    0xC0: ("CPY", IMMEDIATE,   2),
+    0xC4: ("CPY", ZEROPAGE,    3),
+    0xCC: ("CPY", ABSOLUTE,    4),
+
+    0xC6: ("DEC", ZEROPAGE,    5),
+    0xD6: ("DEC", ZEROPAGE_X,  6),
+    0xCE: ("DEC", ABSOLUTE,    6),
+    0xDE: ("DEC", ABSOLUTE_X,  7),
+    0xCA: ("DEX", IMPLIED,     2),
+    0x88: ("DEY", IMPLIED,     2),
+
+    0x49: ("EOR", IMMEDIATE,   2),
+    0x45: ("EOR", ZEROPAGE,    3),
+    0x55: ("EOR", ZEROPAGE_X,  4),
+    0x4D: ("EOR", ABSOLUTE,    4),
+    0x5D: ("EOR", ABSOLUTE_X,  4),
+    0x59: ("EOR", ABSOLUTE_Y,  4),
+    0x41: ("EOR", INDIRECT_X,  6),
+    0x51: ("EOR", INDIRECT_Y,  5),
+
+    0xE6: ("INC", ZEROPAGE,    5),
+    0xF6: ("INC", ZEROPAGE_X,  6),
+    0xEE: ("INC", ABSOLUTE,    6),
+    0xFE: ("INC", ABSOLUTE_X,  7),
+    0xE8: ("INX", IMPLIED,     2),
+    0xC8: ("INY", IMPLIED,     2),
+
+    0x4C: ("JMP", ABSOLUTE,    3),
+    0x6C: ("JMP", INDIRECT,    5),
+    0x20: ("JSR", ABSOLUTE,    6),
+
+    0xA9: ("LDA", IMMEDIATE,   2),
+    0xA5: ("LDA", ZEROPAGE,    3),
+    0xB5: ("LDA", ZEROPAGE_X,  4),
+    0xAD: ("LDA", ABSOLUTE,    4),
+    0xBD: ("LDA", ABSOLUTE_X,  4),
+    0xB9: ("LDA", ABSOLUTE_Y,  4),
+    0xA1: ("LDA", INDIRECT_X,  6),
+    0xB1: ("LDA", INDIRECT_Y,  5),
+
+    0xA2: ("LDX", IMMEDIATE,   2),
+    0xA6: ("LDX", ZEROPAGE,    3),
+    0xB6: ("LDX", ZEROPAGE_Y,  4),
+    0xAE: ("LDX", ABSOLUTE,    4),
+    0xBE: ("LDX", ABSOLUTE_Y,  4),
+
+    0xA0: ("LDY", IMMEDIATE,   2),
+    0xA4: ("LDY", ZEROPAGE,    3),
+    0xB4: ("LDY", ZEROPAGE_X,  4),
+    0xAC: ("LDY", ABSOLUTE,    4),
+    0xBC: ("LDY", ABSOLUTE_X,  4),
+
+    0x4A: ("LSR", ACCUMULATOR, 2),
+    0x46: ("LSR", ZEROPAGE,    5),
+    0x56: ("LSR", ZEROPAGE_X,  6),
+    0x4E: ("LSR", ABSOLUTE,    6),
+    0x5E: ("LSR", ABSOLUTE_X,  7),
+
+    0xEA: ("NOP", IMPLIED,     2),
+
+    0x09: ("ORA", IMMEDIATE,   2),
+    0x05: ("ORA", ZEROPAGE,    3),
+    0x15: ("ORA", ZEROPAGE_X,  4),
+    0x0D: ("ORA", ABSOLUTE,    4),
+    0x1D: ("ORA", ABSOLUTE_X,  4),
+    0x19: ("ORA", ABSOLUTE_Y,  4),
+    0x01: ("ORA", INDIRECT_X,  6),
+    0x11: ("ORA", INDIRECT_Y,  5),
+
+    0x48: ("PHA", IMPLIED,     3),
+    0x08: ("PHP", IMPLIED,     3),
+    0x68: ("PLA", IMPLIED,     4),
+    0x28: ("PLP", IMPLIED,     4),
+
+    0x2A: ("ROL", ACCUMULATOR, 2),
+    0x26: ("ROL", ZEROPAGE,    5),
+    0x36: ("ROL", ZEROPAGE_X,  6),
+    0x2E: ("ROL", ABSOLUTE,    6),
+    0x3E: ("ROL", ABSOLUTE_X,  7),
+
+    0x6A: ("ROR", ACCUMULATOR, 2),
+    0x66: ("ROR", ZEROPAGE,    5),
+    0x76: ("ROR", ZEROPAGE_X,  6),
+    0x6E: ("ROR", ABSOLUTE,    6),
+    0x7E: ("ROR", ABSOLUTE_X,  7),
+
+    0x40: ("RTI", IMPLIED,     6),
+    0x60: ("RTS", IMPLIED,     6),
+
+    0xE9: ("SBC", IMMEDIATE,   2),
+    0xE5: ("SBC", ZEROPAGE,    3),
+    0xF5: ("SBC", ZEROPAGE_X,  4),
+    0xED: ("SBC", ABSOLUTE,    4),
+    0xFD: ("SBC", ABSOLUTE_X,  4),
+    0xF9: ("SBC", ABSOLUTE_Y,  4),
+    0xE1: ("SBC", INDIRECT_X,  6),
+    0xF1: ("SBC", INDIRECT_Y,  5),
+
+    0x38: ("SEC", IMPLIED,     2),
+    0xF8: ("SED", IMPLIED,     2),
+    0x78: ("SEI", IMPLIED,     2),
+
+    0x85: ("STA", ZEROPAGE,    3),
+    0x95: ("STA", ZEROPAGE_X,  4),
+    0x8D: ("STA", ABSOLUTE,    4),
+    0x9D: ("STA", ABSOLUTE_X,  5),
+    0x99: ("STA", ABSOLUTE_Y,  5),
+    0x81: ("STA", INDIRECT_X,  6),
+    0x91: ("STA", INDIRECT_Y,  6),
+
+    0x86: ("STX", ZEROPAGE,    3),
+    0x96: ("STX", ZEROPAGE_Y,  4),
+    0x8E: ("STX", ABSOLUTE,    4),
+
+    0x84: ("STY", ZEROPAGE,    3),
+    0x94: ("STY", ZEROPAGE_X,  4),
+    0x8C: ("STY", ABSOLUTE,    4),
+
+    0xAA: ("TAX", IMPLIED,     2),
+    0xA8: ("TAY", IMPLIED,     2),
+    0xBA: ("TSX", IMPLIED,     2),
+    0x8A: ("TXA", IMPLIED,     2),
+    0x9A: ("TXS", IMPLIED,     2),
+    0x98: ("TYA", IMPLIED,     2)
+}
+
+###############################################################################
+# Handler Generation
+###############################################################################
+def _source_lines(source):
+    return textwrap.dedent(source).strip("\n").splitlines()
+
+def _instruction_source(name, alu_tables):
+    # The (kind, body) of an instruction, from the table-driven bodies if
+    # alu_tables and there is one.
+    if (alu_tables and name in ALU_INSTRUCTIONS):
+        return ALU_INSTRUCTIONS[name]
+    return INSTRUCTIONS[name]
+
+def _execute_lines(op_code, alu_tables=False):
+    # Source for everything after the operand fetch: the addressing mode,
+    # the instruction body and the cycle count.
+    instruction, mode, cycles = OPCODES[op_code]
+    kind, body = _instruction_source(instruction, alu_tables)
+
+    lines = []
+    if (kind == BRANCH):
+        # A taken branch takes one more cycle, two if it lands on another
+        # page than the next instruction.
+        lines.append(f"if ({body}):")
+        lines.append("    pc = self._pc")
+        lines.append("    self._pc = (pc + operand - ((operand&0x80)<<1))&0xFFFF")
+        lines.append(f"    self._system._clock += {cycles + 1} + ((self._pc ^ pc) > 0xFF)")
+        lines.append("else:")
+        lines.append(f"    self._system._clock += {cycles}")
+        return lines
+
+    crossed = kind == READ and mode in PAGE_CROSSING_MODES
+    if (mode == IMMEDIATE):
+        lines.append("value = operand")
+    elif (crossed):
+        lines += _source_lines(PAGE_CROSSING_MODES[mode])
+        lines.append("value = self._read_byte(address)")
+    elif (mode in ADDRESSING_MODES):
+        lines += _source_lines(ADDRESSING_MODES[mode])
+        if (kind in (READ, MODIFY)):
+            lines.append("value = self._read_byte(address)")
+    elif (mode == ACCUMULATOR):
+        lines.append("value = self._a")
+
+    lines += _source_lines(body)
+
+    if (kind == MODIFY):
+        if (mode == ACCUMULATOR):
+            lines.append("self._a = value")
+        else:
+            lines.append("self._write_byte(address, value)")
+
+    lines.append(f"self._system._clock += {cycles} + crossed" if (crossed) else f"self._system._clock += {cycles}")
+    return lines
+
+def generate_handler_source(op_code, alu_tables=False):
+    # Builds the source of a single handler with the operand fetch, the
+    # addressing mode, the instruction body and the cycle count inlined.
+    instruction, mode, cycles = OPCODES[op_code]
+
+    lines = []
+    operand_size = INSTRUCTION_SIZE[mode] - 1
+    if (operand_size > 0):
+        lines += _source_lines(OPERAND_FETCH[operand_size])
+    lines += _execute_lines(op_code, alu_tables)
+
+    name = f"{instruction}_{op_code:02X}"
+    source = f"def {name}(self):\n" + "".join(f"    {line}\n" for line in lines)
+    return name, source
+
+def generate_decoder_source(op_code, alu_tables=False):
+    # Builds the source of a factory taking an instruction's operand and the
+    # address of the next instruction, which returns a handler with both
+    # bound in, for the CPU's block cache. Branch targets, and the cycles a
+    # taken branch takes, are resolved when the handler is built.
+    instruction, mode, cycles = OPCODES[op_code]
+    kind, body = _instruction_source(instruction, alu_tables)
+
+    if (kind == BRANCH):
+        lines = [
+            f"if ({body}):",
+            "    self._pc = target",
+            "    self._system._clock += taken",
+            "else:",
+            "    self._pc = pc",
+            f"    self._system._clock += {cycles}"
+        ]
+    else:
+        lines = ["self._pc = pc"] + _execute_lines(op_code, alu_tables)
+
+    name = f"{instruction}_{op_code:02X}"
+    source = f"def decode_{name}(operand, pc):\n"
+    if (kind == BRANCH):
+        source += "    target = (pc + operand - ((operand&0x80)<<1))&0xFFFF\n"
+        source += f"    taken = {cycles + 1} + ((target ^ pc) > 0xFF)\n"
+    source += f"    def {name}(self):\n" + "".join(f"        {line}\n" for line in lines)
+    source += f"    return {name}\n"
+    return f"decode_{name}", source
+
+def _namespace(alu_tables):
+    # Globals for generated code, the lookup tables if it uses them.
+    return dict(alu.build_tables()) if (alu_tables) else {}
+
+def generate_handler(op_code, alu_tables=False):
+    name, source = generate_handler_source(op_code, alu_tables)
+    namespace = _namespace(alu_tables)
+    exec(compile(source, f"<{name}>", "exec"), namespace)
+    return namespace[name]
+
+def build_dispatch_table(trap, alu_tables=False):
+    # One handler per op code, unassigned op codes go to the trap handler.
+    table = [trap] * 256
+    for op_code in OPCODES:
+        table[op_code] = generate_handler(op_code, alu_tables)
+    return table
+
+def generate_decoder(op_code, alu_tables=False):
+    name, source = generate_decoder_source(op_code, alu_tables)
+    namespace = _namespace(alu_tables)
+    exec(compile(source, f"<{name}>", "exec"), namespace)
+    return namespace[name]
+
+def build_decoder_table(alu_tables=False):
+    # One handler factory per op code, None for unassigned op codes.
+    table = [None] * 256
+    for op_code in OPCODES:
+        table[op_code] = generate_decoder(op_code, alu_tables)
+    return table
+
+# Bytes taken by each op code, unassigned op codes count as 1.
+OPCODE_SIZES = [1] * 256
+for _op_code, (_instruction, _mode, _cycles) in OPCODES.items():
+    OPCODE_SIZES[_op_code] = INSTRUCTION_SIZE[_mode]
+
+# Instructions that can move PC anywhere but the next instruction, which
+# end a run of straight-line code.
+BLOCK_ENDING = set(name for name, (kind, body) in INSTRUCTIONS.items() if kind == BRANCH) | \
+    {"JMP", "JSR", "RTS", "RTI", "BRK"}
+ENDS_BLOCK = [op_code in OPCODES and OPCODES[op_code][0] in BLOCK_ENDING for op_code in range(256)]
+
+# Instructions that change nothing but registers and flags, reading memory
+# at most. Loops made only of these, polling fixed addresses, can be
+# fast-forwarded to the next event, see CPU.execute.
+POLLING = set(name for name, (kind, body) in INSTRUCTIONS.items() if kind in (READ, BRANCH)) | \
+    {"CLC", "CLD", "CLV", "DEX", "DEY", "INX", "INY", "NOP", "SEC", "SED", "TAX", "TAY", "TSX", "TXA", "TYA", "JMP"}
+POLLING_MODES = {IMPLIED, ACCUMULATOR, IMMEDIATE, ZEROPAGE, ABSOLUTE, RELATIVE}
@@ -0,0 +1,331 @@
+import re
+import textwrap
+from instructions import OPCODES, INSTRUCTIONS, INSTRUCTION_SIZE, BLOCK_ENDING, READ, MODIFY, BRANCH, \
+    IMPLIED, ACCUMULATOR, IMMEDIATE, ZEROPAGE, ZEROPAGE_X, ZEROPAGE_Y, ABSOLUTE, ABSOLUTE_X, ABSOLUTE_Y, \
+    INDIRECT, INDIRECT_X, INDIRECT_Y, RELATIVE
+
+# Compiles hot blocks of decoded 6502 code into single Python functions.
+#
+# A compiled block keeps the registers and flags in locals, loaded once on
+# entry and stored back to the CPU only where the block exits. Internal RAM
+# is accessed straight through NES.ram. Anything else goes through the MMU,
+# with the clock brought up to date first so lazily run devices see the
+# right time.
+#
+# The CPU only enters a compiled block when the most cycles it can take,
+# with every page crossing and branch penalty, end before the scheduler's
+# next event, so the only places the block has to check for the
+# event are after memory accesses that can have side effects: writes
+# through the MMU and reads outside internal RAM. Those are the block's
+# exits. Between exits, flag results that are overwritten before anything
+# reads them are never computed.
+#
+# Accesses through the MMU can also raise, e.g. on unemulated registers.
+# The block then stores the registers back as stepping would have left
+# them, with the failing instruction's PC advanced past its operand, and
+# gives the exception the number of instructions it finished as
+# `instructions`.
+#
+# The interpreter in cpu.py stays the reference, running a compiled block
+# has the same effect as stepping through its instructions.
+
+# Locals the compiled code keeps the CPU state in, by CPU attribute.
+REGISTERS = {
+    "_a": "a", "_x": "x", "_y": "y", "_sp": "sp",
+    "_nz": "nz", "_p": "p", "_carry": "c"
+}
+
+# Flags whose dead results are left out.
+FOLDED_FLAGS = ("nz", "c")
+
+# Instructions that are never compiled, blocks holding them stay decoded.
+NOT_COMPILED = {"BRK"}
+
+STATUS = "(p | (0x80 if (nz&0x280) else 0) | (0 if (nz&0xFF) else 0x02) | c)"
+
+_register_pattern = re.compile(r"self\.(" + "|".join(REGISTERS) + r")\b")
+_local_patterns = {name: re.compile(rf"\b{name}\b") for name in REGISTERS.values()}
+_flag_definition = re.compile(r"^(nz|c) = ")
+
+
+class Instruction:
+    # One instruction of a block being compiled.
+    def __init__(self, address, op_code, operand, next_pc):
+        self.address = address
+        self.name, self.mode, self.cycles = OPCODES[op_code]
+        self.operand = operand
+        self.next_pc = next_pc
+        self.lines = []
+        self.exit = False # Has side effects, the block can end after it or raise in it.
+        self.penalty = 0  # Most cycles taken on top of self.cycles.
+
+
+def _ram_index(instruction):
+    # Source for the index into NES.ram of the instruction's effective
+    # address, when that is always in internal RAM. Uses the locals set up
+    # by _address_lines. None otherwise.
+    mode = instruction.mode
+    operand = instruction.operand
+    if (mode in (ZEROPAGE, ABSOLUTE) and operand < 0x2000):
+        return f"{operand&0x7FF}"
+    if (mode in (ZEROPAGE_X, ZEROPAGE_Y)):
+        return "address"
+    if (mode in (ABSOLUTE_X, ABSOLUTE_Y) and operand + 0xFF < 0x2000):
+        return "address&0x7FF"
+    return None
+
+def _address_lines(instruction):
+    # Source leaving the effective address in `address`.
+    mode = instruction.mode
+    operand = instruction.operand
+    if (mode in (ZEROPAGE, ABSOLUTE)):
+        return [f"address = {operand}"]
+    if (mode == ZEROPAGE_X):
+        return [f"address = ({operand} + x)&0xFF"]
+    if (mode == ZEROPAGE_Y):
+        return [f"address = ({operand} + y)&0xFF"]
+    if (mode == ABSOLUTE_X):
+        return [f"address = ({operand} + x)&0xFFFF"]
+    if (mode == ABSOLUTE_Y):
+        return [f"address = ({operand} + y)&0xFFFF"]
+    if (mode == INDIRECT_X):
+        return [
+            f"pointer = ({operand} + x)&0xFF",
+            "address = (ram[(pointer+1)&0xFF]<<8) + ram[pointer]"
+        ]
+    if (mode == INDIRECT_Y):
+        return [f"address = ((ram[{(operand+1)&0xFF}]<<8) + ram[{operand}] + y)&0xFFFF"]
+    if (mode == INDIRECT):
+        # The pointer's high byte is fetched without carrying into the page.
+        high = (operand&0xFF00) | ((operand+1)&0xFF)
+        return [
+            "system._clock = clock",
+            f"address = (read({high})<<8) + read({operand})"
+        ]
+    raise ValueError(f"No effective address for {mode}")
+
+def _page_crossing_lines(instruction):
+    # Source adding the cycle a read takes when indexing crosses into the
+    # next page, after the read. Sets instruction.penalty if it can happen.
+    mode = instruction.mode
+    operand = instruction.operand
+    if (mode in (ABSOLUTE_X, ABSOLUTE_Y) and operand&0xFF):
+        instruction.penalty = 1
+        index = "x" if (mode == ABSOLUTE_X) else "y"
+        return [f"clock += ({operand&0xFF} + {index})>>8"]
+    if (mode == INDIRECT_Y):
+        instruction.penalty = 1
+        return [f"clock += (ram[{operand}] + y)>>8"]
+    return []
+
+def _write_lines(stored):
+    # Source for a write through the MMU. Writes can stall the CPU (OAM
+    # DMA), so the clock is picked up again afterwards.
+    return ["system._clock = clock", f"write(address, {stored})", "clock = system._clock"]
+
+def _translate(line, ram_writes):
+    # Rewrites a line of an instruction body from CPU attributes to the
+    # compiled block's locals. Returns the resulting lines and whether they
+    # have side effects.
+    line = _register_pattern.sub(lambda match: REGISTERS[match.group(1)], line)
+    line = line.replace("self._pc", "pc")
+    line = line.replace("self._get_status_flag()", STATUS)
+
+    lines = []
+    if ("self.pull()" in line):
+        lines += ["sp = (sp + 1)&0xFF", "pulled = ram[0x100 + sp]"]
+        line = line.replace("self.pull()", "pulled")
+
+    match = re.match(r"self\._set_status_flag\((.*)\)$", line)
+    if (match):
+        lines += [
+            f"status = {match.group(1)}",
+            "nz = ((status&0x80)<<2) | (~status&0x02)",
+            "p = status&0x4C",
+            "c = status&0x01 > 0"
+        ]
+        return lines, False
+
+    match = re.match(r"self\.push\((.*?)\)( *#.*)?$", line)
+    if (match):
+        if (ram_writes):
+            return lines + [f"ram[0x100 + sp] = {match.group(1)}", "sp = (sp - 1)&0xFF"], False
+        return lines + [
+            "system._clock = clock",
+            f"write(0x100 + sp, {match.group(1)})",
+            "sp = (sp - 1)&0xFF"
+        ], True
+
+    if ("self." in line):
+        raise ValueError(f"Can't compile {line!r}")
+    return lines + [line], False
+
+def _instruction_lines(instruction, ram_writes):
+    # Source for one instruction, without its cycles. Sets instruction.exit
+    # if it has side effects.
+    kind, body = INSTRUCTIONS[instruction.name]
+    mode = instruction.mode
+    body = [line for line in textwrap.dedent(body).strip("\n").splitlines() if not line.strip().startswith("#")]
+
+    if (kind == BRANCH):
+        operand = instruction.operand
+        target = (instruction.next_pc + operand - ((operand&0x80)<<1))&0xFFFF
+        condition = _translate(body[0], ram_writes)[0][0]
+        instruction.penalty = 1 + ((target ^ instruction.next_pc) > 0xFF)
+        return [
+            f"if ({condition}):",
+            f"    pc = {target}",
+            f"    clock += {instruction.penalty}",
+            "else:",
+            f"    pc = {instruction.next_pc}"
+        ]
+
+    lines = []
+    if (any("self._pc" in line for line in body)):
+        lines.append(f"pc = {instruction.next_pc}")
+
+    ram = None
+    if (mode == IMMEDIATE):
+        lines.append(f"value = {instruction.operand}")
+    elif (mode == ACCUMULATOR):
+        lines.append("value = a")
+    elif (mode not in (IMPLIED, RELATIVE)):
+        ram = _ram_index(instruction)
+        lines += _address_lines(instruction)
+        if (mode == INDIRECT):
+            instruction.exit = True
+        if (kind in (READ, MODIFY)):
+            if (ram is not None):
+                lines.append(f"value = ram[{ram}]")
+            else:
+                lines += ["system._clock = clock", "value = read(address)"]
+                instruction.exit = True
+        if (kind == READ):
+            lines += _page_crossing_lines(instruction)
+
+    # Internal RAM is written directly, unless something watches its writes.
+    direct = ram is not None and ram_writes
+
+    for line in body:
+        if (line.startswith("self._write_byte(address, ")):
+            stored = _translate(line[len("self._write_byte(address, "):-1], ram_writes)[0][0]
+            if (direct):
+                lines.append(f"ram[{ram}] = {stored}")
+            else:
+                lines += _write_lines(stored)
+                instruction.exit = True
+            continue
+        translated, side_effects = _translate(line, ram_writes)
+        lines += translated
+        instruction.exit |= side_effects
+
+    if (kind == MODIFY):
+        if (mode == ACCUMULATOR):
+            lines.append("a = value")
+        elif (direct):
+            lines.append(f"ram[{ram}] = value")
+        else:
+            lines += _write_lines("value")
+            instruction.exit = True
+    return lines
+
+def _fold_flags(instructions):
+    # Drops flag results that are overwritten before anything reads them,
+    # working back from the end of the block. Every flag is live where the
+    # block can exit, and before instructions that can raise.
+    live = set(FOLDED_FLAGS)
+    for instruction in reversed(instructions):
+        if (instruction.exit):
+            live = set(FOLDED_FLAGS)
+        lines = []
+        defined = set()
+        used = set()
+        for line in instruction.lines:
+            match = _flag_definition.match(line)
+            if (match is not None):
+                if (match.group(1) not in live):
+                    continue
+                defined.add(match.group(1))
+                line_uses = line[match.end():]
+            else:
+                line_uses = line
+            used |= set(flag for flag in FOLDED_FLAGS if _local_patterns[flag].search(line_uses))
+            lines.append(line)
+        instruction.lines = lines
+        live = set(FOLDED_FLAGS) if (instruction.exit) else (live - defined) | used
+
+def _writeback(names, pc, clock=True):
+    lines = [f"cpu.{attribute} = {name}" for attribute, name in REGISTERS.items() if name in names]
+    lines.append(f"cpu._pc = {pc}")
+    return lines + ["system._clock = clock"] if (clock) else lines
+
+def compile_block(pc, code, ram_writes=True):
+    # code is the block's list of (op code, operand) starting at pc. Returns
+    # (function, cycles) where function(cpu) runs the block and returns the
+    # number of instructions it ran and cycles is the most it can take
+    # without stalling, or None if the block can't be compiled.
+    # With ram_writes, internal RAM is written without going through the MMU.
+    instructions = []
+    address = pc
+    for op_code, operand in code:
+        if (op_code not in OPCODES or OPCODES[op_code][0] in NOT_COMPILED):
+            return None
+        next_pc = (address + INSTRUCTION_SIZE[OPCODES[op_code][1]])&0xFFFF
+        instructions.append(Instruction(address, op_code, operand, next_pc))
+        address = next_pc
+
+    try:
+        for instruction in instructions:
+            instruction.lines = _instruction_lines(instruction, ram_writes)
+    except ValueError:
+        return None
+    _fold_flags(instructions)
+
+    body = "\n".join(line for instruction in instructions for line in instruction.lines)
+    used = [local for local, pattern in _local_patterns.items() if pattern.search(body)]
+
+    lines = [
+        "system = cpu._system",
+        "scheduler = system.scheduler",
+        "ram = system.ram",
+        "read = cpu._read_byte",
+        "write = cpu._write_byte",
+        "clock = system._clock"
+    ]
+    lines += [f"{local} = cpu.{attribute}" for attribute, local in REGISTERS.items() if local in used]
+
+    # Instructions finished before the one that can raise next.
+    lines.append("done = 0")
+    lines.append("try:")
+    body = []
+    last = instructions[-1]
+    for count, instruction in enumerate(instructions, 1):
+        body.append(f"# {instruction.address:04X} {instruction.name} ({instruction.mode})")
+        if (instruction.exit):
+            body.append(f"done = {count - 1}")
+        body += instruction.lines
+        body.append(f"clock += {instruction.cycles}")
+        if (instruction is last):
+            body += _writeback(used, "pc" if instruction.name in BLOCK_ENDING else instruction.next_pc)
+            body.append(f"return {count}")
+        elif (instruction.exit):
+            body.append("if (scheduler.next_event <= clock):")
+            body += [f"    {line}" for line in _writeback(used, instruction.next_pc)]
+            body.append(f"    return {count}")
+    lines += [f"    {line}" for line in body]
+
+    # The failing instruction's PC is past its operand, as in step(). The
+    # clock was brought up to date before the MMU access that raised.
+    next_pcs = tuple(instruction.next_pc for instruction in instructions)
+    lines.append("except Exception as e:")
+    lines.append("    e.instructions = done")
+    lines += [f"    {line}" for line in _writeback(used, f"{next_pcs}[done]", clock=False)]
+    lines.append("    raise")
+
+    name = f"block_{pc:04X}"
+    source = f"def {name}(cpu):\n" + "".join(f"    {line}\n" for line in lines)
+    namespace = {}
+    exec(compile(source, f"<{name}>", "exec"), namespace)
+    function = namespace[name]
+    function.source = source
+    return function, sum(instruction.cycles + instruction.penalty for instruction in instructions)
@@ -1,102 +1,205 @@
-class MMU:    
-    def __init__(self, system):
-        self._system = system                
-
-    def read_byte(self, address):
-        # Check if memory read is outside addressable memory range.
-        if (address < 0x0000 or address > 0xFFFF):
-            raise RuntimeError(f"Segfault read @ ${hex(address)}")
-
-        #print(f"MMU: Read {hex(address)}")
-
-        # 2KB Internal RAM
-        if (address >= 0x0000 and address <= 0x07FF):
-            return self._system.ram[address]
-
-        # 2KB Internal RAM Mirror #1
-        if (address >= 0x0800 and address <= 0x0FFF):
-            return self._system.ram[address-0x0800]
-
-        # 2KB Internal RAM Mirror #2
-        if (address >= 0x1000 and address <= 0x17FF):
-            return self._system.ram[address-0x1000]
+class MMU:
+    PAGE_SIZE = 0x100
+    PAGE_COUNT = 0x100
 
-        # 2KB Internal RAM Mirror #3
-        if (address >= 0x1800 and address <= 0x1FFF):            
-            return self._system.ram[address-0x1800]
+    __slots__ = (
+        "_system", "_read_memory", "_read_offset", "_read_handler", "_write_memory", "_write_offset",
+        "_write_handler", "_pollable", "_remap_listeners", "_write_watches"
+    )
 
-        # PPU registers
-        if (address >= 0x2000 and address <= 0x2007):
-            return self._system.ppu.read_byte(address)
-
-        # Mirrors of PPU registers (repeat every 8 bytes)
-        if (address >= 0x2008 and address <= 0x3FFF):
-            return self._system.ppu.read_byte(0x2000+(address%8))
-
-        # APU and I/O registers
-        if (address >= 0x4000 and address <= 0x4017):
-            raise NotImplementedError(f"Read @ Address: ${hex(address)}")
-
-        # APU and I/O functionality that is normally disabled
-        if (address >= 0x4018 and address <= 0x401F):
-            raise NotImplementedError(f"Read @ Address: ${hex(address)}")
+    def __init__(self, system):
+        self._system = system
+
+        # Page table, 256 pages of 256 bytes. A page is either backed by a
+        # buffer, in which case the byte for an address lives at
+        # buffer[address + offset], or by read/write handlers for I/O.
+        self._read_memory = [None] * self.PAGE_COUNT
+        self._read_offset = [0] * self.PAGE_COUNT
+        self._read_handler = [self._open_bus_read] * self.PAGE_COUNT
+        self._write_memory = [None] * self.PAGE_COUNT
+        self._write_offset = [0] * self.PAGE_COUNT
+        self._write_handler = [self._open_bus_write] * self.PAGE_COUNT
+        # Per I/O page, the device's check for addresses it can be polled
+        # at, see is_pollable.
+        self._pollable = [None] * self.PAGE_COUNT
+
+        # Called whenever pages are remapped so cached views can be dropped.
+        self._remap_listeners = []
+
+        # Pages whose writes are routed through _watched_write, see
+        # watch_writes: page -> (buffer, write handler, listener).
+        self._write_watches = {}
+
+        # $0000-$1FFF: 2KB Internal RAM, mirrored every 2KB.
+        for page in range(0x00, 0x20):
+            self.map_memory(page, 1, system.ram, (page&0x07)*self.PAGE_SIZE)
+
+        # $2000-$3FFF: PPU registers, mapped by the PPU.
+
+        # $4000-$40FF: APU and I/O registers.
+        self.map_handlers(0x40, 1, self._read_io, self._write_io)
+
+    def map_memory(self, page, count, buffer, offset=0, writable=True):
+        # Maps `count` pages starting at `page` onto buffer[offset:].
+        # Read-only pages keep their write handler.
+        for i in range(count):
+            self._write_watches.pop(page+i, None)
+            adjust = offset + (i*self.PAGE_SIZE) - ((page+i)*self.PAGE_SIZE)
+            self._read_memory[page+i] = buffer
+            self._read_offset[page+i] = adjust
+            self._write_memory[page+i] = buffer if writable else None
+            self._write_offset[page+i] = adjust
+        self._remapped()
+
+    def map_handlers(self, page, count, read, write, pollable=None):
+        # Maps `count` pages starting at `page` onto I/O handlers, which
+        # should be the device's own bound methods. pollable(address), if
+        # given, says whether address can be polled, see is_pollable.
+        for i in range(count):
+            self._write_watches.pop(page+i, None)
+            self._read_memory[page+i] = None
+            self._read_handler[page+i] = read
+            self._write_memory[page+i] = None
+            self._write_handler[page+i] = write
+            self._pollable[page+i] = pollable
+        self._remapped()
+
+    def add_remap_listener(self, listener):
+        self._remap_listeners.append(listener)
+
+    def _remapped(self):
+        for listener in self._remap_listeners:
+            listener()
+
+    def _mirrors(self, page, buffer, offset):
+        # Pages mapping the same bytes of buffer as page does with offset.
+        base = (page*self.PAGE_SIZE) + offset
+        for mirror in range(self.PAGE_COUNT):
+            watch = self._write_watches.get(mirror)
+            memory = watch[0] if watch is not None else self._write_memory[mirror]
+            if (memory is buffer and (mirror*self.PAGE_SIZE) + self._write_offset[mirror] == base):
+                yield mirror
+
+    def watch_writes(self, page, listener):
+        # Makes the next write to the memory behind page, through page or any
+        # page mirroring it, call listener(buffer, index) after storing the
+        # byte at buffer[index]. Returns False, doing nothing, if page isn't
+        # writable memory.
+        if (page in self._write_watches):
+            return True
+        buffer = self._write_memory[page]
+        if (buffer is None):
+            return False
+        offset = self._write_offset[page]
+        for mirror in list(self._mirrors(page, buffer, offset)):
+            self._write_watches[mirror] = (buffer, self._write_handler[mirror], listener)
+            self._write_memory[mirror] = None
+            self._write_handler[mirror] = self._watched_write
+        return True
+
+    def _watched_write(self, address, byte):
+        page = address>>8
+        buffer, handler, listener = self._write_watches[page]
+        offset = self._write_offset[page]
+        for mirror in list(self._mirrors(page, buffer, offset)):
+            self._write_memory[mirror] = buffer
+            self._write_handler[mirror] = self._write_watches.pop(mirror)[1]
+        buffer[address + offset] = byte
+        listener(buffer, address + offset)
+
+    def get_region(self, address):
+        # Returns (buffer, start, end, offset) for the run of pages around
+        # address that share one backing buffer, so buffer[a + offset] holds
+        # the byte for every start <= a < end. None for I/O pages.
+        page = address>>8
+        memory = self._read_memory[page]
+        if (memory is None):
+            return None
+        offset = self._read_offset[page]
+
+        first = page
+        while (first > 0 and self._read_memory[first-1] is memory and self._read_offset[first-1] == offset):
+            first -= 1
+        last = page
+        while (last < self.PAGE_COUNT-1 and self._read_memory[last+1] is memory and self._read_offset[last+1] == offset):
+            last += 1
+        return memory, first*self.PAGE_SIZE, (last+1)*self.PAGE_SIZE, offset
+
+    def is_pollable(self, address):
+        # True if reading address again and again has the same effect as
+        # reading it once, and what it reads can only change on a CPU write
+        # or a scheduled event. Loops polling such addresses can be
+        # fast-forwarded.
+        page = address>>8
+        if (self._read_memory[page] is not None):
+            return True
+        pollable = self._pollable[page]
+        return pollable is not None and pollable(address)
+
+    def map_cartridge(self, cartridge):
+        # $4020-$FFFF: Cartridge space: PRG ROM, PRG RAM, and mapper registers.
+        # Falls back to the cartridge's handlers for anything the mapper
+        # doesn't back with memory.
+        self.map_handlers(0x41, 0xBF, cartridge.read_byte, cartridge.write_byte)
+        cartridge.map_pages(self)
 
-        # Cartridge space: PRG ROM, PRG RAM, and mapper registers
-        if (address >= 0x4020 and address <= 0xFFFF):
-            return self._system.cartridge.read_byte(address)
+    def read_byte(self, address):
+        page = address>>8
+        memory = self._read_memory[page]
+        if (memory is not None):
+            return memory[address + self._read_offset[page]]
+        return self._read_handler[page](address)
 
     def read_word(self, address):
-        return (self.read_byte(address+1)<<8) + self.read_byte(address)
+        # The second byte wraps around to $0000 after $FFFF.
+        return (self.read_byte((address+1)&0xFFFF)<<8) + self.read_byte(address)
 
     def write_byte(self, address, byte):
-        # Check if memory read is outside addressable memory range.
-        if (address < 0x0000 or address > 0xFFFF):
-            raise RuntimeError(f"Segfault write @ ${hex(address)}")
-
-        #print(f"MMU: Write {hex(address)} / {hex(byte)}")
-
-        # 2KB Internal RAM
-        if (address >= 0x0000 and address <= 0x07FF):
-            self._system.ram[address] = byte
+        page = address>>8
+        memory = self._write_memory[page]
+        if (memory is not None):
+            memory[address + self._write_offset[page]] = byte
             return
+        self._write_handler[page](address, byte)
 
-        # 2KB Internal RAM Mirror #1
-        if (address >= 0x0800 and address <= 0x0FFF):
-            self._system.ram[address-0x0800] = byte
-            return
+    def write_word(self, address, word):
+        self.write_byte(address, word&0xFF)
+        self.write_byte((address+1)&0xFFFF, (word>>8)&0xFF)
+
+    def read_page(self, page):
+        # Returns the 256 bytes of a page, as a zero-copy view when the page is
+        # backed by memory.
+        memory = self._read_memory[page]
+        if (memory is not None):
+            start = (page*self.PAGE_SIZE) + self._read_offset[page]
+            return memoryview(memory)[start:start+self.PAGE_SIZE]
+        address = page*self.PAGE_SIZE
+        return bytes(self._read_handler[page](address+i) for i in range(self.PAGE_SIZE))
+
+    def _read_io(self, address):
+        # Cartridge space starts at $4020.
+        if (address >= 0x4020):
+            return self._system.cartridge.read_byte(address)
 
-        # 2KB Internal RAM Mirror #2
-        if (address >= 0x1000 and address <= 0x17FF):
-            self._system.ram[address-0x1000] = byte
-            return
+        # APU and controller registers aren't emulated.
+        raise NotImplementedError(f"Read @ Address: ${hex(address)}")
 
-        # 2KB Internal RAM Mirror #3
-        if (address >= 0x1800 and address <= 0x1FFF):
-            self._system.ram[address-0x1800] = byte
-            return
-
-        # PPU registers
-        if (address >= 0x2000 and address <= 0x2007):
-            self._system.ppu.write_byte(address, byte)
+    def _write_io(self, address, byte):
+        # Cartridge space starts at $4020.
+        if (address >= 0x4020):
+            self._system.cartridge.write_byte(address, byte)
             return
 
-        # Mirrors of PPU registers (repeat every 8 bytes)
-        if (address >= 0x2008 and address <= 0x3FFF):
-            self._system.ppu.write_byte(0x2000+(address%8), byte)
+        # OAM DMA
+        if (address == 0x4014):
+            self._system.ppu.write_oam_dma(byte)
             return
 
-        # APU and I/O registers
-        if (address >= 0x4000 and address <= 0x4017):
-            raise NotImplementedError(f"Write @ Address: ${hex(address)} / Byte: {hex(byte)}")
-
-        # APU and I/O functionality that is normally disabled
-        if (address >= 0x4018 and address <= 0x401F):
-            raise NotImplementedError(f"Write @ Address: ${hex(address)} / Byte: {hex(byte)}")
+        # APU and controller registers aren't emulated.
+        raise NotImplementedError(f"Write @ Address: ${hex(address)} / Byte: {hex(byte)}")
 
-        # Cartridge space: PRG ROM, PRG RAM, and mapper registers
-        if (address >= 0x4020 and address <= 0xFFFF):
-            self._system.cartridge.write_byte(address, byte)
+    def _open_bus_read(self, address):
+        raise RuntimeError(f"Unmapped read @ ${hex(address)}")
 
-    def write_word(self, address, word):
-        self.write_byte(address, word&0xFF)
-        self.write_byte(address+1, word>>8)
\ No newline at end of file
+    def _open_bus_write(self, address, byte):
+        raise RuntimeError(f"Unmapped write @ ${hex(address)} / Byte: {hex(byte)}")
@@ -2,16 +2,39 @@ from cpu import CPU
 from mmu import MMU
 from ppu import PPU
 from cartridge import Cartridge
+from scheduler import Scheduler
 import time
 
+class RunResult:
+    # Counters for a single NES.run call.
+    def __init__(self, reason, instructions, cycles, frames, elapsed, error=None):
+        self.reason = reason             # "instructions", "cycles", "frames", "condition" or "error"
+        self.instructions = instructions # CPU instructions executed
+        self.cycles = cycles             # CPU cycles emulated
+        self.frames = frames             # PPU frames completed
+        self.elapsed = elapsed           # Host seconds spent
+        self.error = error               # Description of the failure when reason is "error"
+
+    def __repr__(self):
+        error = f", error={self.error!r}" if self.error is not None else ""
+        return (f"RunResult(reason={self.reason!r}, instructions={self.instructions}, "
+                f"cycles={self.cycles}, frames={self.frames}, elapsed={self.elapsed:.3f}{error})")
+
+
 class NES:
+    __slots__ = ("_clock", "scheduler", "ram", "ram_view", "mmu", "cpu", "ppu", "cartridge")
+
     def __init__(self):
-        self.cpu = CPU(self)
+        # CPU cycles since power on, the master clock.
+        self._clock = 0
+        self.scheduler = Scheduler(self)
+
+        self.ram = bytearray([0xFF] * 2048) # 2KB of internal RAM.
+        self.ram_view = memoryview(self.ram)
         self.mmu = MMU(self)
+        self.cpu = CPU(self)
         self.ppu = PPU(self)
         self.cartridge = None
-        self.ram = [0xFF] * 2048
-        self._clock = 0
 
     def reset(self):
         self.cpu.reset()
@@ -27,17 +50,88 @@ class NES:
             self.frame()
             #time.sleep(0.016)
 
+    def run(self, frames=None, cycles=None, instructions=None, until=None):
+        # Runs headless until one of the budgets is used up, or until(nes)
+        # returns True after an instruction. Budgets left as None are unlimited.
+        # An exception from the emulator is raised with a `result` attribute,
+        # an "error" RunResult of the counters up to the failure.
+        if (self.cartridge is None):
+            raise RuntimeError("No ROM loaded!")
+        if (frames is None and cycles is None and instructions is None and until is None):
+            raise ValueError("No frame, cycle or instruction budget given")
+
+        infinity = float("inf")
+        frame_limit = infinity if frames is None else frames
+        cycle_limit = infinity if cycles is None else cycles
+        instruction_limit = infinity if instructions is None else instructions
+
+        step = self.cpu.step
+        execute = self.cpu.execute
+        ppu = self.ppu
+        scheduler = self.scheduler
+        start_clock = self._clock
+        start_frame = ppu.frame
+        start_time = time.perf_counter()
+
+        # Ends a batch exactly when the cycle budget runs out.
+        stop_event = None
+        if (cycles is not None):
+            stop_event = scheduler.schedule(start_clock + cycles, lambda: None)
+
+        count = 0
+        reason = None
+        try:
+            while (reason is None):
+                # Run the CPU in a tight batch up to the next event.
+                if (until is None):
+                    count += execute(instruction_limit - count)
+                else:
+                    while (self._clock < scheduler.next_event and count < instruction_limit):
+                        step()
+                        count += 1
+                        if (until(self)):
+                            reason = "condition"
+                            break
+
+                scheduler.run_due()
+
+                if (reason is not None):
+                    pass
+                elif (count >= instruction_limit):
+                    reason = "instructions"
+                elif (self._clock - start_clock >= cycle_limit):
+                    reason = "cycles"
+                elif (ppu.frame - start_frame >= frame_limit):
+                    reason = "frames"
+        except Exception as e:
+            # Keeps how far the run got, for reporting the failure.
+            count += getattr(e, "instructions", 0)
+            e.result = RunResult("error", count, self._clock - start_clock, ppu.frame - start_frame,
+                                 time.perf_counter() - start_time, repr(e))
+            raise
+        finally:
+            if (stop_event is not None):
+                scheduler.cancel(stop_event)
+
+        return RunResult(reason, count, self._clock - start_clock,
+                         ppu.frame - start_frame, time.perf_counter() - start_time)
+
     def frame(self):
-        self.step()                
+        # Runs until the PPU finishes the current frame.
+        self.run(frames=1)
 
     def step(self):
-        self.cpu.step()        
+        self.cpu.step()
+        if (self._clock >= self.scheduler.next_event):
+            self.scheduler.run_due()
 
     def consume_cycles(self, cycles):
-        # Update clock with instruction cycles.
-        self._clock = (self._clock+cycles)&0xFFFFFFFF
-
-        self.ppu.step(cycles)
+        # Update clock with instruction cycles. Devices run from scheduled
+        # events, see Scheduler.
+        self._clock += cycles
 
-    def load_cartridge(self, filename):
-        self.cartridge = Cartridge(filename)
\ No newline at end of file
+    def load_cartridge(self, filename, verbose=True):
+        self.cartridge = Cartridge(filename, verbose)
+        self.mmu.map_cartridge(self.cartridge)
+        self.cartridge.map_pattern_tables(self.ppu)
+        self.cartridge.map_nametables(self.ppu)
\ No newline at end of file
@@ -1,3 +1,5 @@
+from renderer import BackgroundLayer, TileCache, create_renderer
+
 class PPU:
     # More info on NES registers: http://wiki.nesdev.com/w/index.php/PPU_registers
     PPUCTRL   = 0x2000
@@ -10,83 +12,297 @@ class PPU:
     PPUDATA   = 0x2007
     OAMDMA    = 0x4014
 
+    # Nametable mirroring: the physical nametable, of the four 1KB ones at
+    # $2000-$2FFF of ram, each logical nametable shows.
+    HORIZONTAL_MIRRORING = (0, 0, 1, 1)
+    VERTICAL_MIRRORING   = (0, 1, 0, 1)
+    FOUR_SCREEN          = (0, 1, 2, 3)
+
+    __slots__ = (
+        "_system", "ram", "oam", "ram_view", "oam_view", "pattern_tables", "_pattern_tables_writable", "tiles", "background",
+        "nametables", "ctrl", "mask", "status", "oam_address", "v", "t", "fine_x", "w", "_read_buffer", "_bus",
+        "_readers", "_writers", "clock", "scanline", "frame", "_synced_clock", "_event", "renderer", "framebuffer"
+    )
+
     def __init__(self, system):
         self._system = system
-        self.ram = [0xFF] * 16384 # 16kB of video RAM.
-        self.oam = [0xFF] * 256   # 256 bytes of OAM RAM
-
-        self.registers = {
-            0x2000: 0x00, # PPUCTRL
-            0x2001: 0x00, # PPUMASK
-            0x2002: 0x00, # PPUSTATUS
-            0x2003: 0x00, # OAMADDR
-            0x2004: 0x00, # OAMDATA
-            0x2005: 0x00, # PPUSCROLL
-            0x2006: 0x00, # PPUADDR
-            0x2007: 0x00, # PPUDATA
-            0x4014: 0x00  # OAMDMA
-        }
+        self.ram = bytearray([0xFF] * 16384) # 16kB of video RAM.
+        self.oam = bytearray([0xFF] * 256)   # 256 bytes of OAM RAM
+
+        # Zero-copy views for debuggers, save states and DMA.
+        self.ram_view = memoryview(self.ram)
+        self.oam_view = memoryview(self.oam)
+
+        # $2000-$2FFF: Nametables, all four backed by ram until a cartridge
+        # sets up its mirroring.
+        self.nametables = self.FOUR_SCREEN
+
+        # Registers. v is the VRAM address, t the address of the top left of
+        # the screen while rendering, fine_x the fine X scroll and w the
+        # write toggle PPUSCROLL and PPUADDR share.
+        # More info: http://wiki.nesdev.com/w/index.php/PPU_scrolling
+        self.ctrl = 0x00
+        self.mask = 0x00
+        self.status = 0x00
+        self.oam_address = 0x00
+        self.v = 0x0000
+        self.t = 0x0000
+        self.fine_x = 0
+        self.w = 0
+        self._read_buffer = 0x00 # PPUDATA reads below the palettes return the byte read before.
+        self._bus = 0x00         # Last byte read or written.
+
+        # Register handlers by address&0x07.
+        self._readers = (
+            self._read_bus, self._read_bus, self._read_status, self._read_bus,
+            self._read_oam_data, self._read_bus, self._read_bus, self._read_data
+        )
+        self._writers = (
+            self._write_ctrl, self._write_mask, self._write_status, self._write_oam_address,
+            self._write_oam_data, self._write_scroll, self._write_address, self._write_data
+        )
 
         self.clock = 0
         self.scanline = -1
+        self.frame = 0 # Frames completed since power on.
 
-    def read_byte(self, address):        
-        if (address == self.PPUSTATUS):
-            value = self.registers[self.PPUSTATUS]
-            self.registers[self.PPUSTATUS] &= ~0x80 # Clear VBlank
-            return value
-        elif (address == self.OAMDATA):
-            return self.registers[self.OAMDATA]
-        elif (address == self.PPUSCROLL):
-            return self.registers[self.PPUSCROLL]
-        elif (address == self.PPUDATA):
-            value = self.ram[self.registers[self.PPUADDR]] = byte
-            increment = 32 if (self.registers[self.PPUCTRL]&0x04 > 0) else 1
-            self.registers[self.PPUADDR] = (self.registers[self.PPUADDR]+increment)&0xFF
-            return value
-
-        raise RuntimeError(f"Unknown Read @ Address: ${hex(address)}")
+        # Visible scanlines are drawn as they complete into framebuffer, 256x240
+        # palette indices reused every frame. Writes to the nametables and
+        # pattern tables are tracked, so that the background is only redrawn
+        # where it changed.
+        self.background = BackgroundLayer(self)
+        self.set_renderer(None)
 
-    def write_byte(self, address, byte):
-        # print(f"PPU: Write {hex(address)} / {hex(byte)}")
-        if (address == self.PPUCTRL):
-            self.registers[self.PPUCTRL] = byte
-            return
-        elif (address == self.PPUMASK):
-            self.registers[self.PPUMASK] = byte
-            return
-        elif (address == self.OAMADDR):
-            self.registers[self.OAMADDR] = byte
-            return
-        elif (address == self.OAMDATA):
-            self.registers[self.OAMDATA] = byte
-            return
-        elif (address == self.PPUSCROLL):
-            self.registers[self.PPUSCROLL] = byte
-            return
-        elif (address == self.PPUADDR):
-            # 16-bits will be written to this register before accessing PPUDATA.
-            # MSB written first, then LSB 2nd.
-            value = ((self.registers[self.PPUADDR]<<8)+byte)&0xFFFF
-            print(f"ppuaddress byte ${hex(byte)} value ${hex(value)}")
-            self.registers[self.PPUADDR] = value
-            return
-        elif (address == self.PPUDATA):
-            self.ram[self.registers[self.PPUADDR]] = byte
-            increment = 32 if (self.registers[self.PPUCTRL]&0x04 > 0) else 1
-            self.registers[self.PPUADDR] = (self.registers[self.PPUADDR]+increment)&0xFF
+        # The PPU runs lazily, behind the CPU. This is the CPU clock it has
+        # been run up to, it only catches up when one of its registers is
+        # accessed or its next scheduled event is due.
+        self._synced_clock = 0
+        self._event = None
+        self._schedule_next_event()
+
+        # $2000-$3FFF: Registers, mirrored every 8 bytes.
+        system.mmu.map_handlers(0x20, 0x20, self._read_register, self._write_register, self.is_pollable)
+
+        # $0000-$1FFF: Pattern tables, backed by the cartridge's CHR bank once
+        # loaded. Renderers read them decoded, from tiles.
+        self.tiles = TileCache()
+        self.map_pattern_tables(self.ram_view[0x0000:0x2000])
+
+    def set_renderer(self, backend):
+        # Switches the renderer to a backend from renderer.BACKENDS, or to
+        # the fastest available one with None. framebuffer is replaced.
+        self.renderer = create_renderer(self, backend)
+        self.framebuffer = self.renderer.framebuffer
+
+    def catch_up(self):
+        # Runs the PPU up to the CPU's current clock.
+        clock = self._system._clock
+        self.step(clock - self._synced_clock)
+        self._synced_clock = clock
+        # Renderers may hold lines back until now, the PPU state they were
+        # drawn with can only change after this.
+        self.renderer.flush()
+        self._schedule_next_event()
+
+    def _schedule_next_event(self):
+        # Schedules the next catch up for the end of the next scanline that
+        # changes observable state.
+        if (self.scanline == -1 or self.scanline == 241 or self.scanline == 260):
+            scanlines = 0
+        elif (self.scanline < 241):
+            scanlines = 241 - self.scanline
+            hit = self._sprite_zero_line()
+            if (hit is not None):
+                scanlines = min(scanlines, hit - self.scanline)
+        else:
+            scanlines = 260 - self.scanline
+        dots = (341 - self.clock) + (341 * scanlines)
+        time = self._synced_clock + (dots + 2) // 3
+
+        # Catching up doesn't move the next event unless it was passed.
+        if (self._event is not None and self._event[0] == time):
             return
-        elif (address == self.OAMDMA):
-            self.registers[self.OAMDMA] = byte
+        scheduler = self._system.scheduler
+        if (self._event is not None):
+            scheduler.cancel(self._event)
+        self._event = scheduler.schedule(time, self.catch_up)
+
+    def _sprite_zero_line(self):
+        # The next visible scanline, from the current one on, that sprite 0
+        # can set the sprite 0 hit flag on. None if it can't this frame.
+        if (self.mask&0x18 != 0x18 or self.status&0x40):
+            return None
+        top = self.oam[0] + 1
+        height = 16 if (self.ctrl&0x20) else 8
+        line = max(self.scanline, top)
+        if (line >= top + height or line > 239):
+            return None
+        return line
+
+    def _read_register(self, address):
+        self.catch_up()
+        return self.read_byte(address)
+
+    def _write_register(self, address, byte):
+        self.catch_up()
+        self.write_byte(address, byte)
+        # The write may have moved the next sprite 0 hit.
+        self._schedule_next_event()
+
+    def write_oam_dma(self, byte):
+        self.catch_up()
+        self.write_byte(self.OAMDMA, byte)
+        self._schedule_next_event()
+
+    def read_byte(self, address):
+        # Reads register $2000-$2007, or any of its mirrors.
+        self._bus = self._readers[address&0x07]()
+        return self._bus
+
+    def is_pollable(self, address):
+        # PPUSTATUS only changes at scheduled events, sprite 0 hits included,
+        # and reading it again has no further effect.
+        return 0x2000+(address&0x07) == self.PPUSTATUS
+
+    def write_byte(self, address, byte):
+        # Writes register $2000-$2007, or any of its mirrors, or OAMDMA.
+        if (address == self.OAMDMA):
+            self._oam_dma(byte)
             return
+        self._bus = byte
+        self._writers[address&0x07](byte)
+
+    def _read_bus(self):
+        # Write-only registers read back the last byte on the PPU's bus.
+        return self._bus
+
+    def _read_status(self):
+        value = (self.status&0xE0) | (self._bus&0x1F)
+        self.status &= ~0x80 # Clear VBlank
+        self.w = 0
+        return value
+
+    def _read_oam_data(self):
+        return self.oam[self.oam_address]
+
+    def _read_data(self):
+        # Reads below the palettes are delayed by one, they return the
+        # buffered byte and buffer the one at v. Palette reads are direct,
+        # and buffer the nametable byte underneath.
+        address = self.v&0x3FFF
+        if (address >= 0x3F00):
+            value = self._read_byte(address)
+            self._read_buffer = self._read_byte(address - 0x1000)
+        else:
+            value = self._read_buffer
+            self._read_buffer = self._read_byte(address)
+        self.v = (self.v + (32 if (self.ctrl&0x04) else 1))&0x7FFF
+        return value
+
+    def _write_ctrl(self, byte):
+        # Enabling NMI during VBlank triggers it straight away.
+        if (byte&0x80 and not self.ctrl&0x80 and self.status&0x80):
+            self._system.cpu.request_nmi()
+        self.ctrl = byte
+        self.t = (self.t&0x73FF) | ((byte&0x03)<<10) # Base nametable
+
+    def _write_mask(self, byte):
+        self.mask = byte
+
+    def _write_status(self, byte):
+        pass
+
+    def _write_oam_address(self, byte):
+        self.oam_address = byte
 
-        raise RuntimeError(f"Unknown Write @ Address: ${hex(address)} / Byte: {hex(byte)}")
+    def _write_oam_data(self, byte):
+        self.oam[self.oam_address] = byte
+        self.oam_address = (self.oam_address + 1)&0xFF
+
+    def _write_scroll(self, byte):
+        # X scroll first, then Y scroll.
+        if (not self.w):
+            self.t = (self.t&0x7FE0) | (byte>>3)
+            self.fine_x = byte&0x07
+            self.w = 1
+        else:
+            self.t = (self.t&0x0C1F) | ((byte&0x07)<<12) | ((byte&0xF8)<<2)
+            self.w = 0
+
+    def _write_address(self, byte):
+        # High byte first, then low byte, which copies t to v.
+        if (not self.w):
+            self.t = (self.t&0x00FF) | ((byte&0x3F)<<8)
+            self.w = 1
+        else:
+            self.t = (self.t&0x7F00) | byte
+            self.v = self.t
+            self.w = 0
+
+    def _write_data(self, byte):
+        self._write_byte(self.v, byte)
+        self.v = (self.v + (32 if (self.ctrl&0x04) else 1))&0x7FFF
+
+    def _oam_dma(self, page):
+        # Copies CPU page $XX00-$XXFF into OAM, starting at OAMADDR and wrapping.
+        data = self._system.mmu.read_page(page)
+        start = self.oam_address
+        self.oam[start:] = data[:256-start]
+        self.oam[:start] = data[256-start:]
+
+        # The CPU is halted for the 512 cycles of the copy and one more to
+        # wait out the write, plus one if the copy starts on an odd cycle.
+        # The clock is still at the start of the writing instruction, which
+        # in practice is a 4 cycle STA/STX/STY absolute, so it has the same
+        # parity as the end of it.
+        system = self._system
+        system._clock += 513 + (system._clock&1)
+
+    def map_pattern_tables(self, bank):
+        # Maps an 8KB CHR bank in at $0000-$1FFF. CHR ROM banks are read-only
+        # views, writes to them are dropped. Lines up to now are drawn with
+        # the old bank.
+        self.catch_up()
+        self.tiles.select(bank)
+        self.background.invalidate()
+        self.pattern_tables = bank if isinstance(bank, memoryview) else memoryview(bank)
+        self._pattern_tables_writable = not self.pattern_tables.readonly
+
+    def map_nametables(self, mirroring):
+        # Sets the nametable mirroring, one of the *_MIRRORING tuples or
+        # FOUR_SCREEN. Lines up to now are drawn with the old mirroring.
+        self.catch_up()
+        self.nametables = mirroring
+
+    def _palette_address(self, address):
+        # $3F10, $3F14, $3F18 and $3F1C mirror $3F00, $3F04, $3F08 and $3F0C.
+        index = address&0x1F
+        if (index&0x13 == 0x10):
+            index &= 0x0F
+        return 0x3F00 + index
 
     def _read_byte(self, address):
-        return
+        address &= 0x3FFF
+        if (address < 0x2000):
+            return self.pattern_tables[address]
+        if (address < 0x3F00):
+            return self.ram[0x2000 + (self.nametables[(address>>10)&0x03]<<10) + (address&0x3FF)]
+        return self.ram[self._palette_address(address)]
 
     def _write_byte(self, address, byte):
-        return
+        address &= 0x3FFF
+        if (address < 0x2000):
+            if (self._pattern_tables_writable):
+                self.pattern_tables[address] = byte
+                self.tiles.invalidate(address)
+                self.background.invalidate_tile(address)
+            return
+        if (address < 0x3F00):
+            address = 0x2000 + (self.nametables[(address>>10)&0x03]<<10) + (address&0x3FF)
+            self.ram[address] = byte
+            self.background.mark(address)
+            return
+        self.ram[self._palette_address(address)] = byte&0x3F
 
     def step(self, cycles):
         # Note: 1 CPU cycle = 3 PPU cycles
@@ -96,21 +312,48 @@ class PPU:
         # Each PPU cycle is one pixel.
         # There are 262 scanlines per frame.
 
-        if (self.clock >= 341):
+        while (self.clock >= 341):
             self.clock -= 341
             if (self.scanline == -1 or self.scanline == 261):
                 # Pre-render scanline
-                self.registers[self.PPUSTATUS] &= ~0x80 # Clear VBlank
+                self.status &= ~0xE0 # Clear VBlank, sprite 0 hit and sprite overflow
+                if (self.mask&0x18):
+                    self.v = self.t
             elif (self.scanline >= 0 and self.scanline <= 239):
                 # Visible scanline
-                pass
+                self.renderer.render_line(self.scanline, self.v)
+                if (self.mask&0x18):
+                    self._next_line()
             elif (self.scanline == 240):
                 # Post-render scanline
                 pass
             elif (self.scanline == 241):
                 # Vertical blanking lines
-                self.registers[self.PPUSTATUS] |= 0x80 # Enable VBlank
+                self.status |= 0x80 # Enable VBlank
+                if (self.ctrl&0x80):
+                    self._system.cpu.request_nmi()
             elif (self.scanline == 260):
                 self.scanline = -2
+                self.frame += 1
+                self._system.scheduler.end_batch()
+
+            self.scanline += 1
 
-            self.scanline += 1
\ No newline at end of file
+    def _next_line(self):
+        # Moves v down a line and back to the left of the screen, as the
+        # PPU does at the end of every visible line while rendering.
+        v = self.v
+        if (v&0x7000 != 0x7000):
+            v += 0x1000 # Fine Y
+        else:
+            v &= 0x0FFF
+            coarse_y = (v&0x03E0)>>5
+            if (coarse_y == 29):
+                coarse_y = 0
+                v ^= 0x0800 # Next nametable down
+            elif (coarse_y == 31):
+                coarse_y = 0
+            else:
+                coarse_y += 1
+            v = (v&0x7C1F) | (coarse_y<<5)
+        self.v = (v&0x7BE0) | (self.t&0x041F)
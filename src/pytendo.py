@@ -11,11 +11,6 @@ __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file
 
 filename = os.path.join(__location__, "roms\\Donkey Kong.nes")
 
-emulator = NES()
-emulator.load_cartridge(filename)
-emulator.reset()
-emulator.start()
-
 class Window(QtWidgets.QMainWindow):
     def __init__(self):
         super(Window, self).__init__()
@@ -99,7 +94,8 @@ class Window(QtWidgets.QMainWindow):
         self.register_y_text.setText(format(self.emulator.cpu._y,'x').upper())
 
 
-app = QtWidgets.QApplication(sys.argv)
-gui = Window()
-pygame.init()
-sys.exit(app.exec_())
\ No newline at end of file
+if __name__ == "__main__":
+    app = QtWidgets.QApplication(sys.argv)
+    gui = Window()
+    pygame.init()
+    sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,493 @@
+# Scanline renderer. Draws whole scanlines of background and sprites from
+# the PPU's VRAM, OAM and registers into a framebuffer of 256x240 palette
+# indices (0-63, the NES master palette), which is reused every frame.
+#
+# Tile rows are decoded a whole row at a time: SPREAD spreads the 8 bits of
+# a pattern byte into the 8 bytes of an int, one pixel each, so the low and
+# high plane combine into 8 two-bit pixels with one shift and one or, and
+# bytes.translate applies palettes to all of them at once. The PPU keeps the
+# decoded rows in a TileCache until the pattern tables are written.
+#
+# With NumPy installed, NumpyScanlineRenderer uses the tile cache's arrays
+# of tile pixels and draws runs of scanlines at once with array gathers
+# instead. create_renderer picks it when it can.
+
+import collections
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+WIDTH = 256
+HEIGHT = 240
+
+# SPREAD[b].to_bytes(8, "big")[x] is bit 7-x of b.
+SPREAD = [int.from_bytes(bytes((byte>>(7-x))&1 for x in range(8)), "big") for byte in range(256)]
+
+def _palette_table(base):
+    # Translation table from two-bit pixels to palette RAM indices, with
+    # transparent pixels left at 0.
+    return bytes([0, base+1, base+2, base+3]) + bytes(252)
+
+# Background pixels by attribute palette, sprite pixels by OAM palette.
+BACKGROUND_PALETTES = [_palette_table(palette<<2) for palette in range(4)]
+SPRITE_PALETTES = [_palette_table(0x10 + (palette<<2)) for palette in range(4)]
+
+
+class _DecodedBank:
+    __slots__ = ("bank", "rows", "array", "stale")
+
+    def __init__(self, bank):
+        self.bank = bank
+        self.rows = [None] * 0x2000 # Only the low plane addresses are used.
+        self.array = None           # Every tile as [table, tile, row, column], for NumPy.
+        self.stale = set()          # Rows of array that changed since it was decoded.
+
+
+class TileCache:
+    # Decoded tile rows of the pattern table banks the PPU maps in, keyed by
+    # the address of the row's low plane byte. Rows are decoded on first use
+    # and dropped again when the PPU writes to them. Up to `limit` banks stay
+    # decoded, the least recently mapped one is dropped to make room.
+    __slots__ = ("_limit", "_banks", "_current", "rows")
+
+    def __init__(self, limit=4):
+        self._limit = limit
+        self._banks = collections.OrderedDict()
+        self._current = None
+        self.rows = None
+
+    def select(self, bank):
+        # Switches to the decoded rows of `bank`, an 8KB pattern table bank.
+        decoded = self._banks.pop(id(bank), None)
+        if (decoded is None or decoded.bank is not bank):
+            decoded = _DecodedBank(bank)
+        self._banks[id(bank)] = decoded
+        while (len(self._banks) > self._limit):
+            self._banks.popitem(last=False)
+        self._current = decoded
+        self.rows = decoded.rows
+
+    def row(self, address):
+        # The 8 two-bit pixels of the tile row whose low plane is at address,
+        # left to right. Renderers check rows[address] first.
+        row = self.rows[address]
+        if (row is None):
+            patterns = self._current.bank
+            row = (SPREAD[patterns[address]] | (SPREAD[patterns[address + 8]]<<1)).to_bytes(8, "big")
+            self.rows[address] = row
+        return row
+
+    def invalidate(self, address):
+        # Drops the row the byte at address belongs to, after a write.
+        address &= 0x1FF7
+        self.rows[address] = None
+        if (self._current.array is not None):
+            self._current.stale.add(address)
+
+    def array(self):
+        # The whole bank as a [table, tile, row, column] array, for NumPy.
+        decoded = self._current
+        if (decoded.array is None):
+            planes = numpy.frombuffer(bytes(decoded.bank), numpy.uint8).reshape(512, 2, 8)
+            bits = numpy.unpackbits(planes, axis=2)
+            decoded.array = (bits[:, 0] | (bits[:, 1]<<1)).reshape(2, 256, 8, 8)
+            decoded.stale.clear()
+        elif (decoded.stale):
+            for address in decoded.stale:
+                decoded.array[address>>12, (address>>4)&0xFF, address&0x07] = numpy.frombuffer(self.row(address), numpy.uint8)
+            decoded.stale.clear()
+        return decoded.array
+
+def scroll(v, fine_x, nametables):
+    # The position a line starts at in the background, from VRAM address v
+    # and fine X: (x, y, nametable, next nametable), with the physical
+    # nametables of mirroring `nametables`. Coarse Y 30 and 31 wrap to the
+    # top of the nametable.
+    logical = (v>>10)&0x03
+    x = ((v&0x1F)<<3) | fine_x
+    y = ((((v>>5)&0x1F)<<3) | ((v>>12)&0x07)) % HEIGHT
+    return x, y, nametables[logical], nametables[logical ^ 0x01]
+
+
+class BackgroundLayer:
+    # The four nametables at $2000-$2FFF drawn as 256x240 images of palette
+    # RAM indices, one after the other in pixels. Cells are redrawn only
+    # when their name or attribute byte, their tile or the background
+    # pattern table changes, renderers copy lines of background out of it.
+    __slots__ = ("_ppu", "pixels", "_table", "_built", "_cells", "_tiles")
+
+    NAMETABLE_SIZE = WIDTH*HEIGHT
+
+    def __init__(self, ppu):
+        self._ppu = ppu
+        self.pixels = bytearray(4*self.NAMETABLE_SIZE)
+        self._table = None        # Pattern table the cells were drawn from.
+        self._built = [False] * 4 # Nametables drawn in full.
+        self._cells = set()       # Name byte offsets from $2000 of cells to redraw.
+        self._tiles = set()       # Tiles (table<<8 | tile) whose pattern changed.
+
+    def invalidate(self):
+        # Redraws everything on next use, after pattern table bank switches
+        # or writes to VRAM that didn't go through the PPU.
+        self._built = [False] * 4
+        self._cells.clear()
+        self._tiles.clear()
+
+    def invalidate_tile(self, address):
+        # Redraws the cells showing the tile the pattern byte at address
+        # belongs to.
+        self._tiles.add(address>>4)
+
+    def mark(self, address):
+        # Redraws the cells a write to nametable byte address ($2000-$2FFF)
+        # changes, one for a name byte and up to 16 for an attribute byte.
+        offset = address&0x0FFF
+        index = offset&0x3FF
+        if (index < 960):
+            self._cells.add(offset)
+            return
+        base = (offset&0xC00) + (((index - 960)>>3)<<7) + (((index - 960)&0x07)<<2)
+        for row in range(0, min(4, 30 - ((base&0x3FF)>>5))):
+            for column in range(4):
+                self._cells.add(base + (row<<5) + column)
+
+    def update(self, table, nametables):
+        # Brings the cells of `nametables` up to date for background pattern
+        # table `table` ($0000 or $1000).
+        if (table != self._table):
+            self._table = table
+            self.invalidate()
+        if (self._tiles):
+            self._mark_tiles()
+        if (self._cells):
+            cells = self._cells
+            built = self._built
+            for offset in cells:
+                if (built[offset>>10]):
+                    self._draw_cell(offset)
+            cells.clear()
+        for nametable in nametables:
+            if (not self._built[nametable]):
+                for row in range(30):
+                    for column in range(32):
+                        self._draw_cell((nametable<<10) + (row<<5) + column)
+                self._built[nametable] = True
+
+    def _mark_tiles(self):
+        names = self._ppu.ram[0x2000:0x3000]
+        for tile in self._tiles:
+            if ((tile&0x100) != self._table>>4):
+                continue
+            name = tile&0xFF
+            offset = names.find(name)
+            while (offset != -1):
+                if (offset&0x3FF < 960):
+                    self._cells.add(offset)
+                offset = names.find(name, offset + 1)
+        self._tiles.clear()
+
+    def _draw_cell(self, offset):
+        ram = self._ppu.ram
+        tiles = self._ppu.tiles
+        rows = tiles.rows
+        row = (offset&0x3FF)>>5
+        column = offset&0x1F
+        attribute = ram[0x23C0 + (offset&0xC00) + ((row>>2)<<3) + (column>>2)]
+        palette = BACKGROUND_PALETTES[(attribute>>(((row&0x02)<<1) | (column&0x02)))&0x03]
+
+        address = self._table + (ram[0x2000 + offset]<<4)
+        start = (offset>>10)*self.NAMETABLE_SIZE + (row<<11) + (column<<3)
+        pixels = self.pixels
+        for fine in range(8):
+            pixels[start:start+8] = (rows[address + fine] or tiles.row(address + fine)).translate(palette)
+            start += WIDTH
+
+
+class ScanlineRenderer:
+    __slots__ = ("_ppu", "framebuffer", "_line", "_claimed", "_palette", "_colors")
+
+    def __init__(self, ppu):
+        self._ppu = ppu
+        self.framebuffer = bytearray(WIDTH*HEIGHT)
+
+        # The scanline being drawn as palette RAM indices, and which of its
+        # pixels a sprite has been drawn to.
+        self._line = bytearray(WIDTH)
+        self._claimed = bytearray(WIDTH)
+
+        # Palette RAM the translation from palette RAM indices to colours
+        # was built from.
+        self._palette = None
+        self._colors = None
+
+    def render_line(self, line, v):
+        # Draws scanline `line` (0-239) with the PPU's current state, its
+        # background scrolled to VRAM address v and the PPU's fine X.
+        ppu = self._ppu
+        ctrl = ppu.ctrl
+        mask = ppu.mask
+        colors = self._palette_colors()
+        start = line*WIDTH
+
+        if (not mask&0x18):
+            # Rendering is off, the screen shows the backdrop colour.
+            self.framebuffer[start:start+WIDTH] = bytes([colors[0]])*WIDTH
+            return
+
+        pixels = self._line
+        if (mask&0x08):
+            self._render_background(v, ctrl, mask)
+        else:
+            pixels[:] = bytes(WIDTH)
+        if (mask&0x10):
+            self._render_sprites(line, ctrl, mask)
+        self.framebuffer[start:start+WIDTH] = pixels.translate(colors)
+
+    def flush(self):
+        # Lines are drawn straight away, nothing is held back.
+        pass
+
+    def _palette_colors(self):
+        # Translation table from palette RAM indices (0-31) to colours. Every
+        # fourth entry shows the backdrop colour at $3F00.
+        palette = bytes(self._ppu.ram[0x3F00:0x3F20])
+        if (palette != self._palette):
+            self._palette = palette
+            self._colors = bytes(palette[index if (index&0x03) else 0]&0x3F for index in range(32)) + bytes(224)
+        return self._colors
+
+    def _render_background(self, v, ctrl, mask):
+        # Copies the line out of the background layer, from the nametable
+        # v points into and, scrolled, the one to its right.
+        ppu = self._ppu
+        background = ppu.background
+        x, y, left, right = scroll(v, ppu.fine_x, ppu.nametables)
+        background.update((ctrl&0x10)<<8, (left, right))
+        layer = background.pixels
+        pixels = self._line
+        start = left*BackgroundLayer.NAMETABLE_SIZE + y*WIDTH
+        pixels[0:WIDTH-x] = layer[start+x:start+WIDTH]
+        if (x):
+            start = right*BackgroundLayer.NAMETABLE_SIZE + y*WIDTH
+            pixels[WIDTH-x:WIDTH] = layer[start:start+x]
+
+        if (not mask&0x02):
+            pixels[0:8] = bytes(8)
+
+    def _render_sprites(self, line, ctrl, mask):
+        # Draws the first 8 sprites on the line in OAM order. A pixel goes
+        # to the first sprite with an opaque pixel there, even if that sprite
+        # is behind the background.
+        ppu = self._ppu
+        oam = ppu.oam
+        tiles = ppu.tiles
+        pixels = self._line
+        claimed = self._claimed
+        claimed[:] = bytes(WIDTH)
+        height = 16 if (ctrl&0x20) else 8
+        clip = 0 if (mask&0x04) else 8
+        hit_clip = 8 if (clip or not mask&0x02) else 0
+        test_hit = mask&0x08 and not ppu.status&0x40
+
+        count = 0
+        for index in range(0, 256, 4):
+            row = line - oam[index] - 1
+            if (not 0 <= row < height):
+                continue
+            tile = oam[index + 1]
+            attributes = oam[index + 2]
+            left = oam[index + 3]
+
+            if (attributes&0x80):
+                row = height - 1 - row
+            if (height == 16):
+                table = (tile&0x01)<<12
+                tile = (tile&0xFE) + (row>>3)
+                row &= 0x07
+            else:
+                table = (ctrl&0x08)<<9
+            row_pixels = tiles.row(table + (tile<<4) + row)
+            if (attributes&0x40):
+                row_pixels = row_pixels[::-1]
+            row_pixels = row_pixels.translate(SPRITE_PALETTES[attributes&0x03])
+            behind = attributes&0x20
+
+            for x in range(max(left, clip), min(left + 8, WIDTH)):
+                color = row_pixels[x - left]
+                if (not color or claimed[x]):
+                    continue
+                claimed[x] = 1
+                if (pixels[x]&0x03):
+                    # Sprite 0 hit: an opaque sprite 0 pixel over an opaque
+                    # background pixel.
+                    if (index == 0 and test_hit and hit_clip <= x < 255):
+                        ppu.status |= 0x40
+                        test_hit = False
+                    if (behind):
+                        continue
+                pixels[x] = color
+
+            count += 1
+            if (count == 8):
+                break
+
+
+class NumpyScanlineRenderer(ScanlineRenderer):
+    # Draws the same scanlines as ScanlineRenderer, into the same framebuffer,
+    # with NumPy. Lines are held back and drawn together, as arrays of whole
+    # lines, when flush is called: the PPU flushes whenever it catches up,
+    # before anything the lines depend on can change.
+    __slots__ = ("_background", "_oam", "_screen", "_color_bytes", "_color_array", "_first", "_end", "_addresses")
+
+    COLUMNS = None
+
+    def __init__(self, ppu):
+        super().__init__(ppu)
+        if (NumpyScanlineRenderer.COLUMNS is None):
+            NumpyScanlineRenderer.COLUMNS = numpy.arange(WIDTH)
+
+        # Views of the background layer, OAM and the framebuffer, none of
+        # them copy.
+        self._background = numpy.frombuffer(ppu.background.pixels, numpy.uint8)
+        self._oam = numpy.frombuffer(ppu.oam, numpy.uint8).reshape(64, 4)
+        self._screen = numpy.frombuffer(self.framebuffer, numpy.uint8).reshape(HEIGHT, WIDTH)
+
+        # _colors as an array.
+        self._color_bytes = None
+        self._color_array = None
+
+        # Lines waiting to be drawn, first to end exclusive, and the VRAM
+        # address for each.
+        self._first = None
+        self._end = None
+        self._addresses = []
+
+    def render_line(self, line, v):
+        if (self._first is not None and line != self._end):
+            self.flush()
+        if (self._first is None):
+            self._first = line
+        self._end = line + 1
+        self._addresses.append(v)
+
+    def flush(self):
+        # Draws the lines held back, with the PPU's current state.
+        if (self._first is None):
+            return
+        first = self._first
+        end = self._end
+        addresses = self._addresses
+        self._first = None
+        self._addresses = []
+
+        ppu = self._ppu
+        ctrl = ppu.ctrl
+        mask = ppu.mask
+        colors = self._palette_array()
+
+        if (not mask&0x18):
+            self._screen[first:end] = colors[0]
+            return
+
+        if (mask&0x08):
+            pixels = self._background_arrays(addresses, ctrl, mask)
+        else:
+            pixels = numpy.zeros((end - first, WIDTH), numpy.uint8)
+        if (mask&0x10):
+            pixels = self._sprite_arrays(ppu.tiles.array(), numpy.arange(first, end), pixels, ctrl, mask)
+        self._screen[first:end] = colors[pixels]
+
+    def _palette_array(self):
+        colors = self._palette_colors()
+        if (colors is not self._color_bytes):
+            self._color_bytes = colors
+            self._color_array = numpy.frombuffer(colors, numpy.uint8)[:32]
+        return self._color_array
+
+    def _background_arrays(self, addresses, ctrl, mask):
+        # Background pixels as palette RAM indices, a row per line, gathered
+        # from the background layer at each line's scroll position.
+        ppu = self._ppu
+        ppu.background.update((ctrl&0x10)<<8, ppu.nametables)
+        v = numpy.array(addresses)
+        x = ((v&0x1F)<<3) + ppu.fine_x
+        y = ((((v>>5)&0x1F)<<3) | ((v>>12)&0x07)) % HEIGHT
+        columns = x[:, None] + self.COLUMNS
+        logical = ((v>>10)&0x03)[:, None] ^ (columns>>8)
+        nametables = numpy.array(ppu.nametables)[logical]
+        pixels = self._background[(nametables*HEIGHT + y[:, None])*WIDTH + (columns&0xFF)]
+        if (not mask&0x02):
+            pixels[:, 0:8] = 0
+        return pixels
+
+    def _sprite_arrays(self, tiles, lines, pixels, ctrl, mask):
+        # Draws sprites over the background pixels. Sprites are drawn from
+        # the last one in OAM to the first, so every pixel ends up with the
+        # first opaque sprite pixel there, even if that one is behind the
+        # background.
+        ppu = self._ppu
+        oam = self._oam
+        height = 16 if (ctrl&0x20) else 8
+        clip = 0 if (mask&0x04) else 8
+        hit_clip = 8 if (clip or not mask&0x02) else 0
+        test_hit = mask&0x08 and not ppu.status&0x40
+
+        # The first 8 sprites on each line.
+        rows = lines[:, None] - 1 - oam[:, 0].astype(numpy.int64)
+        visible = (rows >= 0) & (rows < height)
+        visible &= numpy.cumsum(visible, axis=1) <= 8
+
+        # Sprite pixels as palette RAM indices with 0x20 set when behind
+        # the background, padded for sprites hanging off the right edge.
+        layer = numpy.zeros((len(lines), WIDTH + 8), numpy.uint8)
+        for index in numpy.flatnonzero(visible.any(axis=0))[::-1].tolist():
+            on = numpy.flatnonzero(visible[:, index])
+            row = rows[on, index]
+            tile, attributes, left = oam[index, 1:].tolist()
+
+            if (attributes&0x80):
+                row = height - 1 - row
+            if (height == 16):
+                table = tile&0x01
+                tile = (tile&0xFE) + (row>>3)
+                row = row&0x07
+            else:
+                table = (ctrl&0x08)>>3
+            sprite = tiles[table, tile, row]
+            if (attributes&0x40):
+                sprite = sprite[:, ::-1]
+
+            color = 0x10 + ((attributes&0x03)<<2) + (attributes&0x20)
+            area = layer[on, left:left+8]
+            layer[on, left:left+8] = numpy.where(sprite, sprite | color, area)
+
+            if (index == 0 and test_hit):
+                # Sprite 0 hit: an opaque sprite 0 pixel over an opaque
+                # background pixel.
+                opaque = numpy.zeros((len(lines), WIDTH + 8), numpy.bool_)
+                opaque[on, left:left+8] = sprite != 0
+                opaque = opaque[:, hit_clip:255] & (pixels[:, hit_clip:255]&0x03 != 0)
+                if (opaque.any()):
+                    ppu.status |= 0x40
+
+        layer = layer[:, :WIDTH]
+        layer[:, 0:clip] = 0
+        shown = (layer != 0) & ((layer&0x20 == 0) | (pixels&0x03 == 0))
+        return numpy.where(shown, layer&0x1F, pixels)
+
+
+# Renderers by backend name, "numpy" only when NumPy can be imported.
+BACKENDS = {"python": ScanlineRenderer}
+if (numpy is not None):
+    BACKENDS["numpy"] = NumpyScanlineRenderer
+
+def create_renderer(ppu, backend=None):
+    # Creates a renderer for ppu, NumPy's if no backend is given and it is
+    # available, the pure Python one otherwise.
+    if (backend is None):
+        backend = "numpy" if ("numpy" in BACKENDS) else "python"
+    if (backend not in BACKENDS):
+        raise ValueError(f"Unknown renderer backend: {backend!r}, available: {', '.join(sorted(BACKENDS))}")
+    return BACKENDS[backend](ppu)
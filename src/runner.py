@@ -0,0 +1,103 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cartridge import load_rom_image
+from nes import NES, RunResult
+
+# Fans headless NES runs out over a process pool, one emulator per job.
+# e.g. python runner.py roms/*.nes --frames 600 --workers 8 --chunksize 4
+
+class Job:
+    # A single headless run. `setup(nes)` is called after reset and before
+    # running, e.g. to feed an input sequence; it has to be a picklable,
+    # module level function. `tag` is passed back untouched with the result.
+    def __init__(self, rom, frames=None, cycles=None, instructions=None, pc=None, setup=None, tag=None):
+        self.rom = rom
+        self.frames = frames
+        self.cycles = cycles
+        self.instructions = instructions
+        self.pc = pc
+        self.setup = setup
+        self.tag = tag
+
+    def __repr__(self):
+        return f"Job(rom={self.rom!r}, tag={self.tag!r})"
+
+
+# ROM images kept mapped for the lifetime of a worker, so every job on that
+# worker reuses one mapping instead of mapping the file per job.
+_worker_images = []
+
+def _init_worker(roms):
+    for rom in roms:
+        _worker_images.append(load_rom_image(rom))
+
+def run_job(job):
+    start_time = time.perf_counter()
+    try:
+        emulator = NES()
+        emulator.load_cartridge(job.rom, verbose=False)
+        emulator.reset()
+        if (job.pc is not None):
+            emulator.cpu._pc = job.pc
+        if (job.setup is not None):
+            job.setup(emulator)
+        return emulator.run(frames=job.frames, cycles=job.cycles, instructions=job.instructions)
+    except Exception as e:
+        # Failures in the run report how far it got, see NES.run.
+        result = getattr(e, "result", None)
+        if (result is None):
+            result = RunResult("error", 0, 0, 0, time.perf_counter() - start_time, repr(e))
+        return result
+
+def _run_chunk(chunk):
+    return [(index, run_job(job)) for index, job in chunk]
+
+def run_parallel(jobs, workers=None, chunksize=1):
+    # Runs jobs across `workers` processes (default: one per core), handing
+    # them out `chunksize` at a time. Yields (job, RunResult) pairs as chunks
+    # finish, so results stream back in completion order, not job order.
+    jobs = list(jobs)
+    indexed = list(enumerate(jobs))
+    chunks = [indexed[start:start+chunksize] for start in range(0, len(indexed), chunksize)]
+
+    roms = sorted(set(job.rom for job in jobs))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(roms,)) as executor:
+        futures = [executor.submit(_run_chunk, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            for index, result in future.result():
+                yield jobs[index], result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many NES ROMs headless across a process pool.")
+    parser.add_argument("roms", nargs="+", help="paths to iNES ROMs")
+    parser.add_argument("--frames", type=int, help="stop each run after this many PPU frames")
+    parser.add_argument("--cycles", type=int, help="stop each run after this many CPU cycles")
+    parser.add_argument("--instructions", type=int, help="stop each run after this many CPU instructions")
+    parser.add_argument("--pc", type=lambda value: int(value, 16), help="start execution here (hex) instead of the reset vector")
+    parser.add_argument("--repeat", type=int, default=1, help="run every ROM this many times")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunksize", type=int, default=1, help="jobs handed to a worker at a time")
+    args = parser.parse_args(argv)
+
+    if (args.frames is None and args.cycles is None and args.instructions is None):
+        parser.error("at least one of --frames, --cycles or --instructions is required")
+
+    jobs = []
+    for rom in args.roms:
+        for run in range(args.repeat):
+            jobs.append(Job(rom, args.frames, args.cycles, args.instructions, args.pc, tag=run))
+
+    start_time = time.perf_counter()
+    instructions = 0
+    for job, result in run_parallel(jobs, args.workers, args.chunksize):
+        instructions += result.instructions
+        print(f"{job.rom} #{job.tag}: {result}")
+    elapsed = time.perf_counter() - start_time
+    print(f"{len(jobs)} runs, {instructions} instructions in {elapsed:.3f}s ({instructions/elapsed:,.0f} instructions/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import heapq
+
+class Scheduler:
+    # Master event queue, timestamped on the CPU clock. Devices schedule
+    # their next event (scanline boundaries, VBlank/NMI, mapper IRQs, APU
+    # frame counter ticks, ...) and the NES runs the CPU in a tight batch up
+    # to next_event before dispatching whatever is due.
+    __slots__ = ("_system", "_queue", "_sequence", "next_event")
+
+    def __init__(self, system):
+        self._system = system
+        self._queue = []
+        self._sequence = 0 # Keeps events due on the same cycle in scheduling order.
+
+        # CPU clock of the earliest pending event.
+        self.next_event = float("inf")
+
+    def schedule(self, time, callback):
+        # Calls callback() once the CPU clock reaches time. Returns a handle
+        # for cancel().
+        event = [time, self._sequence, callback]
+        self._sequence += 1
+        heapq.heappush(self._queue, event)
+        if (time < self.next_event):
+            self.next_event = time
+        return event
+
+    def cancel(self, event):
+        # Cancelled events stay queued and are skipped when they come up.
+        event[2] = None
+
+    def end_batch(self):
+        # Makes the current CPU batch stop after the running instruction,
+        # for state changes outside the queue that the run loop should see.
+        self.next_event = self._system._clock
+
+    def run_due(self):
+        queue = self._queue
+        while (queue and queue[0][0] <= self._system._clock):
+            callback = heapq.heappop(queue)[2]
+            if (callback is not None):
+                callback()
+        self.next_event = queue[0][0] if queue else float("inf")
@@ -0,0 +1,260 @@
+import collections
+import gzip
+import lzma
+import struct
+from instructions import OPCODES, OPCODE_SIZES, IMPLIED, ACCUMULATOR, IMMEDIATE, ZEROPAGE, ZEROPAGE_X, \
+    ZEROPAGE_Y, ABSOLUTE, ABSOLUTE_X, ABSOLUTE_Y, INDIRECT, INDIRECT_X, INDIRECT_Y, RELATIVE
+
+# Execution tracing. Nothing here runs unless a Tracer is attached with
+# CPU.set_tracer, the untraced CPU.step has no tracing code in it at all.
+#
+# A trace record is a tuple of
+# (pc, op code, operand byte 1, operand byte 2, a, x, y, p, sp, cycle)
+# taken before the instruction executes. Operand bytes past the end of the
+# instruction are 0 and cycle is the CPU clock.
+
+# Binary traces are MAGIC followed by fixed size little endian records of
+# pc, op code, operand byte 1, operand byte 2, a, x, y, p, sp, cycle.
+MAGIC = b"NESTRC\x00\x01"
+RECORD = struct.Struct("<H8BQ")
+
+# Record fields, in order, as reported by the diff tool.
+FIELDS = ("PC", "OP", "OP1", "OP2", "A", "X", "Y", "P", "SP", "CYC")
+
+def open_trace_file(filename, mode):
+    # Opens a trace file, compressed by extension: .gz for gzip, .xz for lzma.
+    if (filename.endswith(".gz")):
+        return gzip.open(filename, mode)
+    if (filename.endswith(".xz")):
+        return lzma.open(filename, mode)
+    return open(filename, mode)
+
+
+class Tracer:
+    # Takes one record per instruction and hands them to a sink in batches of
+    # `batch` records. With `ring` set only the last `ring` records are kept,
+    # and they are written when the tracer is flushed or closed.
+    def __init__(self, sink, ring=None, batch=4096):
+        self._sink = sink
+        self._ring = ring
+        self._batch = batch
+        if (ring is None):
+            self._records = []
+        else:
+            self._records = collections.deque(maxlen=ring)
+
+    def record(self, cpu):
+        pc = cpu._pc
+        read = cpu._read_byte
+        op_code = read(pc)
+        size = OPCODE_SIZES[op_code]
+        operand_1 = read((pc+1)&0xFFFF) if size > 1 else 0
+        operand_2 = read((pc+2)&0xFFFF) if size > 2 else 0
+        records = self._records
+        records.append((pc, op_code, operand_1, operand_2, cpu._a, cpu._x, cpu._y,
+                        cpu._get_status_flag() | 0x20, cpu._sp, cpu._system._clock))
+        if (self._ring is None and len(records) >= self._batch):
+            self.flush()
+
+    def flush(self):
+        if (len(self._records) > 0):
+            self._sink.write(list(self._records))
+            self._records.clear()
+
+    def close(self):
+        self.flush()
+        self._sink.close()
+
+
+###############################################################################
+# Sinks
+###############################################################################
+class PCSink:
+    # One hex program counter per line.
+    def __init__(self, filename):
+        self._file = open_trace_file(filename, "wt")
+
+    def write(self, records):
+        self._file.write("".join(f"{record[0]:04X}\n" for record in records))
+
+    def close(self):
+        self._file.close()
+
+
+class NestestSink:
+    # Lines in the layout of nestest.log. The "= XX" memory annotations are
+    # left out since reading I/O registers for them would have side effects.
+    def __init__(self, filename):
+        self._file = open_trace_file(filename, "wt")
+
+    def write(self, records):
+        self._file.write("".join(format_nestest(record) + "\n" for record in records))
+
+    def close(self):
+        self._file.close()
+
+
+class BinarySink:
+    # MAGIC, then one RECORD per instruction.
+    def __init__(self, filename):
+        self._file = open_trace_file(filename, "wb")
+        self._file.write(MAGIC)
+
+    def write(self, records):
+        pack = RECORD.pack
+        self._file.write(b"".join(pack(*record) for record in records))
+
+    def close(self):
+        self._file.close()
+
+
+class MemorySink:
+    # Keeps the records in the `records` list, for checking a run in process.
+    def __init__(self):
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+    def close(self):
+        pass
+
+
+SINKS = {
+    "pc": PCSink,
+    "nestest": NestestSink,
+    "binary": BinarySink
+}
+
+
+###############################################################################
+# Formatting
+###############################################################################
+def disassemble(op_code, operand_1, operand_2, pc):
+    if (op_code not in OPCODES):
+        return f".DB ${op_code:02X}"
+    instruction, mode, cycles = OPCODES[op_code]
+    word = (operand_2<<8) + operand_1
+    if (mode == IMPLIED):
+        return instruction
+    if (mode == ACCUMULATOR):
+        return f"{instruction} A"
+    if (mode == IMMEDIATE):
+        return f"{instruction} #${operand_1:02X}"
+    if (mode == ZEROPAGE):
+        return f"{instruction} ${operand_1:02X}"
+    if (mode == ZEROPAGE_X):
+        return f"{instruction} ${operand_1:02X},X"
+    if (mode == ZEROPAGE_Y):
+        return f"{instruction} ${operand_1:02X},Y"
+    if (mode == ABSOLUTE):
+        return f"{instruction} ${word:04X}"
+    if (mode == ABSOLUTE_X):
+        return f"{instruction} ${word:04X},X"
+    if (mode == ABSOLUTE_Y):
+        return f"{instruction} ${word:04X},Y"
+    if (mode == INDIRECT):
+        return f"{instruction} (${word:04X})"
+    if (mode == INDIRECT_X):
+        return f"{instruction} (${operand_1:02X},X)"
+    if (mode == INDIRECT_Y):
+        return f"{instruction} (${operand_1:02X}),Y"
+    if (mode == RELATIVE):
+        target = (pc + 2 + operand_1 - ((operand_1&0x80)<<1))&0xFFFF
+        return f"{instruction} ${target:04X}"
+
+def format_nestest(record):
+    pc, op_code, operand_1, operand_2, a, x, y, p, sp, cycle = record
+    size = OPCODE_SIZES[op_code]
+    code = " ".join(f"{byte:02X}" for byte in (op_code, operand_1, operand_2)[:size])
+    return (f"{pc:04X}  {code:<10}{disassemble(op_code, operand_1, operand_2, pc):<32}"
+            f"A:{a:02X} X:{x:02X} Y:{y:02X} P:{p:02X} SP:{sp:02X} CYC:{(cycle*3)%341:3d}")
+
+def format_differences(expected, actual):
+    # "FIELD expected/actual" for every field two records differ in. The
+    # nestest layout can hide them: operand bytes past the op code's size,
+    # and cycles that are equal modulo a scanline.
+    differences = []
+    for field, a, b in zip(FIELDS, expected, actual):
+        if (a != b):
+            if (field == "CYC"):
+                differences.append(f"{field} {a}/{b}")
+            else:
+                differences.append(f"{field} ${a:02X}/${b:02X}")
+    return differences
+
+
+
+###############################################################################
+# Reading
+###############################################################################
+def is_binary_trace(filename):
+    with open_trace_file(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+def read_binary_chunks(filename, records=4096):
+    # Yields the raw record bytes of a binary trace, `records` at a time.
+    with open_trace_file(filename, "rb") as file:
+        if (file.read(len(MAGIC)) != MAGIC):
+            raise ValueError(f"{filename} is not a binary trace")
+        size = records*RECORD.size
+        while True:
+            chunk = file.read(size)
+            # A trace cut short by a crash can end in a partial record, drop it.
+            chunk = chunk[:len(chunk) - len(chunk)%RECORD.size]
+            if (len(chunk) == 0):
+                return
+            yield chunk
+
+def read_binary_trace(filename):
+    for chunk in read_binary_chunks(filename):
+        yield from RECORD.iter_unpack(chunk)
+
+def parse_nestest_line(line, cycle):
+    # Parses a nestest.log line into a record. nestest.log only gives the
+    # PPU dot, so the CPU cycle is carried over from the previous line:
+    # no instruction takes a scanline, so the dot delta is unambiguous.
+    registers = line.find("A:", 16)
+    if (registers < 0):
+        raise ValueError(f"Not a nestest.log line: {line!r}")
+    code = [int(byte, 16) for byte in line[6:15].split()] + [0, 0]
+    fields = line[registers:].split()
+    a, x, y, p, sp = (int(field.split(":")[1], 16) for field in fields[:5])
+    dot = int(line[line.find("CYC:", registers)+4:].split()[0])
+    return (int(line[0:4], 16), code[0], code[1], code[2], a, x, y, p, sp, cycle), dot
+
+def read_nestest_trace(filename, cycle=0):
+    # Yields records for a nestest.log style text trace, with the first line
+    # at CPU cycle `cycle`.
+    with open_trace_file(filename, "rt") as file:
+        dot = None
+        for line in file:
+            if (line.strip() == ""):
+                continue
+            record, line_dot = parse_nestest_line(line, cycle)
+            if (dot is not None):
+                cycle += ((line_dot - dot) % 341) // 3
+                record = record[:9] + (cycle,)
+            dot = line_dot
+            yield record
+
+def read_trace(filename):
+    # Yields the records of a binary or nestest.log style trace.
+    if (is_binary_trace(filename)):
+        return read_binary_trace(filename)
+    return read_nestest_trace(filename)
+
+def convert_trace(source, destination):
+    # Writes any readable trace out as a binary trace. Returns the record count.
+    sink = BinarySink(destination)
+    count = 0
+    batch = []
+    for record in read_trace(source):
+        batch.append(record)
+        if (len(batch) >= 4096):
+            sink.write(batch)
+            count += len(batch)
+            batch.clear()
+    sink.write(batch)
+    sink.close()
+    return count + len(batch)
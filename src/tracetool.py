@@ -0,0 +1,104 @@
+import argparse
+import collections
+import itertools
+import sys
+import time
+from tracer import FIELDS, RECORD, convert_trace, format_differences, format_nestest, is_binary_trace, read_binary_chunks, read_trace
+
+# Converts and compares execution traces. Both commands take binary traces
+# or nestest.log style text traces, optionally .gz/.xz compressed.
+# e.g. python tracetool.py convert roms/nestest.log.txt nestest.trc
+#      python headless.py roms/nestest.nes --pc C000 --instructions 5003 --trace run.trc --trace-format binary
+#      python tracetool.py diff nestest.trc run.trc
+
+class Divergence:
+    # The first record at which two traces differ. `expected`/`actual` are
+    # None where one trace ended early; `context` holds the records before it.
+    def __init__(self, index, expected, actual, context):
+        self.index = index
+        self.expected = expected
+        self.actual = actual
+        self.context = context
+
+    @property
+    def fields(self):
+        if (self.expected is None or self.actual is None):
+            return []
+        return [FIELDS[i] for i, (a, b) in enumerate(zip(self.expected, self.actual)) if a != b]
+
+def _first_raw_difference(expected, actual):
+    # Streams two binary traces chunk by chunk, skipping identical chunks
+    # without unpacking them. Returns the index of the first differing
+    # record, or None if the traces are identical.
+    index = 0
+    for chunk_a, chunk_b in itertools.zip_longest(read_binary_chunks(expected), read_binary_chunks(actual), fillvalue=b""):
+        if (chunk_a != chunk_b):
+            for offset in range(0, max(len(chunk_a), len(chunk_b)), RECORD.size):
+                if (chunk_a[offset:offset+RECORD.size] != chunk_b[offset:offset+RECORD.size]):
+                    return index + offset//RECORD.size
+        index += len(chunk_a)//RECORD.size
+    return None
+
+def diff_traces(expected, actual, ignore=(), context=5):
+    # Returns the first Divergence between two trace files, or None if they
+    # match. Fields named in `ignore` (see tracer.FIELDS) aren't compared.
+    mask = [i for i, field in enumerate(FIELDS) if field not in ignore]
+
+    skip = 0
+    if (len(mask) == len(FIELDS) and is_binary_trace(expected) and is_binary_trace(actual)):
+        skip = _first_raw_difference(expected, actual)
+        if (skip is None):
+            return None
+        skip = max(0, skip - context)
+
+    history = collections.deque(maxlen=context)
+    index = skip
+    records = itertools.zip_longest(itertools.islice(read_trace(expected), skip, None),
+                                    itertools.islice(read_trace(actual), skip, None))
+    for a, b in records:
+        if (a != b and (a is None or b is None or any(a[i] != b[i] for i in mask))):
+            return Divergence(index, a, b, list(history))
+        history.append(a)
+        index += 1
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert and compare CPU execution traces.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="convert a trace to the binary format")
+    convert.add_argument("source", help="binary or nestest.log style trace")
+    convert.add_argument("destination", help="binary trace to write")
+
+    diff = commands.add_parser("diff", help="report the first divergence between two traces")
+    diff.add_argument("expected", help="reference trace, e.g. roms/nestest.log.txt")
+    diff.add_argument("actual", help="trace to check")
+    diff.add_argument("--ignore", action="append", default=[], choices=FIELDS, help="field to leave out of the comparison, may be repeated")
+    diff.add_argument("--context", type=int, default=5, help="matching records to show before the divergence")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    if (args.command == "convert"):
+        count = convert_trace(args.source, args.destination)
+        print(f"{count} records written to {args.destination} in {(time.perf_counter() - start_time)*1000:.1f}ms")
+        return 0
+
+    divergence = diff_traces(args.expected, args.actual, args.ignore, args.context)
+    elapsed = (time.perf_counter() - start_time)*1000
+    if (divergence is None):
+        print(f"Traces match ({elapsed:.1f}ms)")
+        return 0
+
+    print(f"First divergence at record {divergence.index} (line {divergence.index+1}) ({elapsed:.1f}ms)")
+    for record in divergence.context:
+        print(f"    {format_nestest(record)}")
+    expected = format_nestest(divergence.expected) if divergence.expected is not None else "<end of trace>"
+    actual = format_nestest(divergence.actual) if divergence.actual is not None else "<end of trace>"
+    print(f"  - {expected}")
+    print(f"  + {actual}")
+    if (divergence.fields):
+        print(f"Fields (expected/actual): {', '.join(format_differences(divergence.expected, divergence.actual))}")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
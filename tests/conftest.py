@@ -0,0 +1,53 @@
+import os
+import sys
+import pytest
+
+# The emulator's modules import each other by name, as run from src.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from nes import NES
+
+def build_rom(program, nmi=None, chr_rom=None, flags=0x00):
+    # An NROM iNES image with 16KB of PRG ROM, mapped at $8000 and $C000.
+    # program maps addresses to the bytes placed there. Reset starts at
+    # $C000, the NMI vector points at nmi or at an RTI. chr_rom defaults to
+    # 8KB of zeros, an empty one gives CHR RAM. flags is header byte 6.
+    prg = bytearray(0x4000)
+    for address, data in program.items():
+        prg[address&0x3FFF:(address&0x3FFF) + len(data)] = bytes(data)
+    if (nmi is None):
+        nmi = 0xFFF0
+        prg[0x3FF0] = 0x40 # RTI
+    prg[0x3FFA:0x4000] = bytes([nmi&0xFF, nmi>>8, 0x00, 0xC0, 0x00, 0xC0])
+    chr_rom = bytes(0x2000) if chr_rom is None else bytes(chr_rom)
+    return b"NES\x1a" + bytes([1, len(chr_rom)//0x2000, flags, 0]) + bytes(8) + bytes(prg) + chr_rom
+
+def snapshot(nes):
+    # Everything running or stepping has to agree on, with the PPU caught up.
+    cpu = nes.cpu
+    ppu = nes.ppu
+    ppu.catch_up()
+    return {
+        "registers": (cpu._pc, cpu._a, cpu._x, cpu._y, cpu._sp, cpu._get_status_flag()),
+        "clock": nes._clock,
+        "ram": bytes(nes.ram),
+        "nmi": cpu._nmi_pending,
+        "ppu": (ppu.frame, ppu.scanline, ppu.clock, ppu.ctrl, ppu.mask, ppu.status, ppu.oam_address,
+                ppu.v, ppu.t, ppu.fine_x, ppu.w, ppu._read_buffer),
+        "oam": bytes(ppu.oam)
+    }
+
+@pytest.fixture
+def make_nes(tmp_path):
+    # Returns make(program, nmi=None, chr_rom=None, flags=0x00), a reset NES
+    # running the ROM build_rom makes of them.
+    roms = []
+    def make(program, nmi=None, chr_rom=None, flags=0x00):
+        path = tmp_path / f"test{len(roms)}.nes"
+        path.write_bytes(build_rom(program, nmi, chr_rom, flags))
+        roms.append(path)
+        nes = NES()
+        nes.load_cartridge(str(path), verbose=False)
+        nes.reset()
+        return nes
+    return make
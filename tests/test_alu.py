@@ -0,0 +1,39 @@
+import pytest
+from instructions import build_decoder_table
+
+# The alu.py lookup tables against the arithmetic they stand in for: every
+# table-driven handler has to leave the registers, flags and memory as the
+# computing one does, for every register value, operand and carry.
+
+ARITHMETIC = build_decoder_table(alu_tables=False)
+TABLES = build_decoder_table(alu_tables=True)
+
+def _state(cpu):
+    return (cpu._a, cpu._x, cpu._y, cpu._get_status_flag(), cpu._nz&0xFF, cpu._system.ram[0x10])
+
+@pytest.mark.parametrize("name, op_code", (
+    ("ADC", 0x69), ("SBC", 0xE9),                 # Immediate
+    ("CMP", 0xC9), ("CPX", 0xE0), ("CPY", 0xC0),
+    ("ASL", 0x0A), ("LSR", 0x4A), ("ROL", 0x2A), ("ROR", 0x6A), # Accumulator
+    ("ASL", 0x06), ("LSR", 0x46), ("ROL", 0x26), ("ROR", 0x66)  # Zero page $10
+))
+def test_tables_match_arithmetic(make_nes, name, op_code):
+    cpu = make_nes({}).cpu
+    ram = cpu._system.ram
+    # The accumulator shifts only use A, the zero page ones only $10. The
+    # others use an immediate operand and A, X or Y.
+    zero_page = op_code&0x0F == 0x06
+    accumulator = op_code&0x0F == 0x0A
+    for operand in range(1 if (accumulator) else 256):
+        handlers = [decoders[op_code](0x10 if (zero_page) else operand, 0xC002) for decoders in (ARITHMETIC, TABLES)]
+        for register in range(1 if (zero_page) else 256):
+            for carry in (0, 1):
+                states = []
+                for handler in handlers:
+                    cpu._a = cpu._x = cpu._y = register
+                    cpu._carry = carry
+                    cpu._p = 0x24 if (carry) else 0x64 # V set and clear
+                    ram[0x10] = operand
+                    handler(cpu)
+                    states.append(_state(cpu))
+                assert states[0] == states[1], f"{name} ${op_code:02X}: register ${register:02X}, operand ${operand:02X}, carry {carry}"
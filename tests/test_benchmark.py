@@ -0,0 +1,139 @@
+import json
+import pytest
+import benchmark
+from conftest import build_rom
+from tracer import MemorySink, Tracer, format_nestest
+
+# The conformance check and the regression comparison against the history,
+# on a small ROM and a log of its own run standing in for nestest.
+
+# Adds up X in A, storing it.
+PROGRAM = {
+    0xC000: [0xE8,             # INX
+             0x8A,             # TXA
+             0x69, 0x10,       # ADC #$10
+             0x85, 0x10,       # STA $10
+             0x4C, 0x00, 0xC0] # JMP C000
+}
+
+LINES = 1000
+
+@pytest.fixture
+def rom(tmp_path):
+    path = tmp_path / "test.nes"
+    path.write_bytes(build_rom(PROGRAM))
+    return str(path)
+
+@pytest.fixture
+def records(rom):
+    # The records of the ROM's first LINES instructions, as benchmark runs it.
+    emulator = benchmark._new_emulator(rom)
+    sink = MemorySink()
+    tracer = Tracer(sink)
+    emulator.cpu.set_tracer(tracer)
+    emulator.run(instructions=LINES)
+    tracer.close()
+    return sink.records
+
+def _write_log(path, records):
+    path.write_text("".join(format_nestest(record) + "\n" for record in records))
+    return str(path)
+
+def _changed(record, **fields):
+    # record with the named fields (see tracer.FIELDS) replaced.
+    record = list(record)
+    for field, value in fields.items():
+        record[benchmark.FIELDS.index(field)] = value
+    return tuple(record)
+
+def test_matching_log_conforms(rom, records, tmp_path):
+    log = _write_log(tmp_path / "test.log", records)
+    assert benchmark.check_conformance(rom, log) == {"lines": LINES, "registers": LINES, "cycles": LINES, "mismatch": None}
+
+def test_register_mismatch_names_the_fields(rom, records, tmp_path):
+    actual = records[500]
+    records[500] = _changed(actual, A=actual[4] ^ 0x01, X=0x99)
+    log = _write_log(tmp_path / "test.log", records)
+    conformance = benchmark.check_conformance(rom, log)
+    assert (conformance["registers"], conformance["cycles"]) == (500, 500)
+    mismatch = conformance["mismatch"]
+    assert mismatch["line"] == 501
+    assert mismatch["expected"] == format_nestest(records[500])
+    assert mismatch["actual"] == format_nestest(actual)
+    assert mismatch["fields"] == [f"A ${actual[4] ^ 0x01:02X}/${actual[4]:02X}", f"X $99/${actual[5]:02X}"]
+
+def test_cycle_mismatch_only_counts_against_cycles(rom, records, tmp_path):
+    records[300] = _changed(records[300], CYC=records[300][9] + 1)
+    log = _write_log(tmp_path / "test.log", records)
+    conformance = benchmark.check_conformance(rom, log)
+    assert (conformance["registers"], conformance["cycles"], conformance["mismatch"]) == (LINES, 300, None)
+
+def test_find_regressions():
+    previous = {"conformance": {"registers": 900, "cycles": 800},
+                "throughput": {"instructions_per_second": 1000000, "cycles_per_second": 3000000}}
+    current = {"conformance": {"registers": 900, "cycles": 700},
+               "throughput": {"instructions_per_second": 890000, "cycles_per_second": 2800000}}
+    assert benchmark.find_regressions(previous, current, 0.10) == [
+        "cycles conformance dropped from 800 to 700 lines",
+        "instructions per second dropped 11.0% (1,000,000 -> 890,000)"
+    ]
+    assert benchmark.find_regressions(previous, current, 0.15) == ["cycles conformance dropped from 800 to 700 lines"]
+    assert benchmark.find_regressions(current, previous, 0.10) == []
+
+@pytest.fixture
+def throughput(monkeypatch):
+    # Stands in for the timed runs, with the instructions per second to
+    # report in throughput["instructions_per_second"].
+    throughput = {"instructions_per_second": 1000000}
+    def measure_throughput(rom, instructions, repeat, alu_tables=False):
+        return {"instructions": instructions, "cycles": instructions*3,
+                "instructions_per_second": throughput["instructions_per_second"],
+                "cycles_per_second": throughput["instructions_per_second"]*3}
+    monkeypatch.setattr(benchmark, "measure_throughput", measure_throughput)
+    return throughput
+
+def _main(rom, log, history, *options):
+    return benchmark.main([rom, "--log", log, "--history", history, "--repeat", "1", *options])
+
+def test_history_is_compared_and_appended(rom, records, tmp_path, capsys, throughput):
+    log = _write_log(tmp_path / "test.log", records)
+    history = str(tmp_path / "history.json")
+
+    assert _main(rom, log, history) == 0
+    saved = json.loads((tmp_path / "history.json").read_text())
+    assert len(saved) == 1
+    assert saved[0]["conformance"]["registers"] == LINES
+    assert saved[0]["throughput"]["instructions_per_second"] == 1000000
+    assert "REGRESSION" not in capsys.readouterr().out
+
+    # Within the threshold.
+    throughput["instructions_per_second"] = 950000
+    assert _main(rom, log, history) == 0
+    assert "REGRESSION" not in capsys.readouterr().out
+
+    # Compared with the last run, not the first.
+    throughput["instructions_per_second"] = 870000
+    assert _main(rom, log, history, "--no-save") == 0
+    throughput["instructions_per_second"] = 800000
+    assert _main(rom, log, history) == 1
+    out = capsys.readouterr().out
+    assert "REGRESSION: instructions per second dropped 15.8% (950,000 -> 800,000)" in out
+    assert "REGRESSION: cycles per second dropped 15.8%" in out
+    assert len(json.loads((tmp_path / "history.json").read_text())) == 3
+
+    assert _main(rom, log, history, "--threshold", "0.5") == 0
+
+def test_conformance_regression_is_reported(rom, records, tmp_path, capsys, throughput):
+    history = str(tmp_path / "history.json")
+    assert _main(rom, _write_log(tmp_path / "test.log", records), history) == 0
+    capsys.readouterr()
+
+    expected = records[700][6]
+    records[700] = _changed(records[700], Y=expected + 1)
+    assert _main(rom, _write_log(tmp_path / "test.log", records), history) == 1
+    out = capsys.readouterr().out
+    assert f"Registers: 700/{LINES} lines" in out
+    assert "First mismatch at line 701:" in out
+    assert f"Fields (expected/actual): Y ${expected + 1:02X}/${expected:02X}" in out
+    assert f"REGRESSION: registers conformance dropped from {LINES} to 700 lines" in out
+    assert f"REGRESSION: cycles conformance dropped from {LINES} to 700 lines" in out
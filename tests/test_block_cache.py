@@ -0,0 +1,158 @@
+import random
+from conftest import build_rom, snapshot
+
+# Block cache and run loop tests. NES.run goes through CPU.execute and the
+# block cache, NES.step interprets one instruction at a time and is the
+# reference.
+
+# Counts NMIs in $10 and waits on them, with the X and Y registers ticking.
+NMI_LOOP = {
+    0xC000: [0xA9, 0x80, 0x8D, 0x00, 0x20, # LDA #$80 ; STA $2000
+             0xA5, 0x10,                   # C005 LDA $10
+             0xC9, 0x01,                   # CMP #1
+             0xD0, 0xFA,                   # BNE C005
+             0xA9, 0x00, 0x85, 0x10,       # LDA #0 ; STA $10
+             0xE8,                         # INX
+             0x4C, 0x05, 0xC0],            # JMP C005
+    0xC100: [0xE6, 0x10, 0xC8, 0x40]       # NMI: INC $10 ; INY ; RTI
+}
+
+# OAM DMA, indexed reads crossing pages and taken branches.
+DMA_LOOP = {
+    0xC000: [0xA9, 0x80, 0x8D, 0x00, 0x20, # LDA #$80 ; STA $2000
+             0xA9, 0x02, 0x8D, 0x14, 0x40, # C005 LDA #2 ; STA $4014
+             0xE8,                         # C00A INX
+             0xBD, 0xF0, 0x02,             # LDA $02F0,X
+             0xB1, 0x10,                   # LDA ($10),Y
+             0xC8,                         # INY
+             0xD0, 0xF7,                   # BNE C00A
+             0x4C, 0x05, 0xC0],            # JMP C005
+    0xC100: [0xE6, 0x10, 0xC8, 0x40]       # NMI: INC $10 ; INY ; RTI
+}
+
+# Copies a subroutine to $0300 that rewrites its own LDA operand, and calls
+# it forever, rewriting the operand again through a mirror of $0300.
+SELF_MODIFYING = {
+    0xC000: [0xA9, 0x80, 0x8D, 0x00, 0x20, # LDA #$80 ; STA $2000
+             0xA2, 0x00,                   # LDX #0
+             0xBD, 0x00, 0xC2,             # C007 LDA $C200,X
+             0x9D, 0x00, 0x03,             # STA $0300,X
+             0xE8, 0xE0, 0x10, 0xD0, 0xF5, # INX ; CPX #16 ; BNE C007
+             0x20, 0x00, 0x03,             # C012 JSR $0300
+             0xEE, 0x01, 0x0B,             # INC $0B01
+             0x4C, 0x12, 0xC0],            # JMP C012
+    0xC100: [0xE6, 0x20, 0x40],            # NMI: INC $20 ; RTI
+    0xC200: [0xA9, 0x01, 0x18, 0x65, 0x11, # LDA #1 ; CLC ; ADC $11
+             0x85, 0x11,                   # STA $11
+             0xEE, 0x01, 0x03,             # INC $0301
+             0x60]                         # RTS
+}
+
+# Copies INC $11 ; RTS to $0300 and calls it forever.
+RAM_SUBROUTINE = {
+    0xC000: [0xA2, 0x00,                   # LDX #0
+             0xBD, 0x00, 0xC2,             # C002 LDA $C200,X
+             0x9D, 0x00, 0x03,             # STA $0300,X
+             0xE8, 0xE0, 0x03, 0xD0, 0xF5, # INX ; CPX #3 ; BNE C002
+             0x20, 0x00, 0x03,             # C00D JSR $0300
+             0x4C, 0x0D, 0xC0],            # JMP C00D
+    0xC200: [0xE6, 0x11, 0x60]             # INC $11 ; RTS
+}
+
+def _run_and_step(make_nes, program, instructions, nmi=None):
+    # Runs one NES and steps another through the same instructions in
+    # randomly sized runs, checking they agree after each.
+    running = make_nes(program, nmi)
+    stepping = make_nes(program, nmi)
+    chunks = random.Random(1)
+    done = 0
+    while (done < instructions):
+        count = chunks.randint(1, 3000)
+        result = running.run(instructions=count)
+        assert result.instructions == count
+        for i in range(count):
+            stepping.step()
+        done += count
+        assert snapshot(running) == snapshot(stepping), f"after {done} instructions"
+    return running
+
+def test_run_matches_step_waiting_for_nmi(make_nes):
+    nes = _run_and_step(make_nes, NMI_LOOP, 60000, nmi=0xC100)
+    assert nes.ppu.frame > 0 and nes.cpu._y > 0
+
+def test_run_matches_step_with_dma(make_nes):
+    nes = _run_and_step(make_nes, DMA_LOOP, 60000, nmi=0xC100)
+    assert nes.ppu.frame > 0
+
+def test_run_matches_step_with_self_modifying_code(make_nes):
+    nes = _run_and_step(make_nes, SELF_MODIFYING, 60000, nmi=0xC100)
+    assert nes.ram[0x20] > 0
+
+def test_run_matches_step_for_cycle_and_frame_budgets(make_nes):
+    running = make_nes(NMI_LOOP, 0xC100)
+    stepping = make_nes(NMI_LOOP, 0xC100)
+    for budget in ({"cycles": 12345}, {"frames": 2}, {"cycles": 1}, {"frames": 1}):
+        result = running.run(**budget)
+        for i in range(result.instructions):
+            stepping.step()
+        assert snapshot(running) == snapshot(stepping), budget
+
+def test_writes_to_ram_drop_blocks_decoded_from_it(make_nes):
+    nes = make_nes(RAM_SUBROUTINE)
+    nes.run(instructions=3000)
+    blocks = nes.cpu._block_cache[(id(nes.ram), 0)][1]
+    assert 0x0300 in blocks
+    assert blocks[0x0300][2] # Compiled
+
+    # INC $11 becomes INC $12, written through a mirror of $0300.
+    nes.mmu.write_byte(0x0B01, 0x12)
+    assert 0x0300 not in blocks
+    count = nes.ram[0x11]
+    nes.run(instructions=3000)
+    assert nes.ram[0x11] == count
+    assert nes.ram[0x12] > 0
+
+def test_remapping_drops_cached_code(make_nes):
+    nes = make_nes({0xC000: [0xE8, 0x4C, 0x00, 0xC0]}) # INX ; JMP C000
+    nes.run(instructions=3000)
+    assert nes.cpu._code is not None
+
+    # INY ; JMP C000
+    bank = bytearray(build_rom({0xC000: [0xC8, 0x4C, 0x00, 0xC0]})[16:0x4010])
+    nes.mmu.map_memory(0xC0, 0x40, bank, writable=False)
+    assert nes.cpu._code is None
+    assert nes.cpu._blocks is None
+    x = nes.cpu._x
+    nes.run(instructions=3000)
+    assert nes.cpu._x == x
+    assert nes.cpu._y == 1500&0xFF
+
+def test_remapping_ends_the_running_block(make_nes):
+    # A mapper write switching banks in the middle of a hot block, the rest
+    # of the block has to run from the new bank.
+    program = {
+        0xC000: [0xE8,             # INX
+                 0x8E, 0x00, 0x50, # STX $5000
+                 0xE8,             # C004 INX, INY after the switch
+                 0x4C, 0x00, 0xC0] # JMP C000
+    }
+    switched = dict(program)
+    switched[0xC004] = [0xC8, 0x4C, 0x04, 0xC0] # INY ; JMP C004
+    bank = bytearray(build_rom(switched)[16:0x4010])
+
+    def make():
+        nes = make_nes(program)
+        def write(address, byte):
+            if (byte == 199):
+                nes.mmu.map_memory(0xC0, 0x40, bank, writable=False)
+        nes.mmu.map_handlers(0x50, 1, lambda address: 0, write)
+        return nes
+
+    running = make()
+    stepping = make()
+    running.run(instructions=1000)
+    for i in range(1000):
+        stepping.step()
+    assert snapshot(running) == snapshot(stepping)
+    assert running.cpu._x == 199
+    assert running.cpu._y > 0
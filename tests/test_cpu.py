@@ -0,0 +1,25 @@
+import pytest
+
+# Interpreter tests, for step() and the block cache's fallback to it.
+
+@pytest.mark.parametrize("run", (False, True))
+@pytest.mark.parametrize("op_code, operand, a, pc", (
+    (0xA9, [0x42], 0x42, 0x0001),      # LDA #$42
+    (0xAD, [0x10, 0x00], 0x99, 0x0002) # LDA $0010
+))
+def test_operand_fetch_wraps_to_zero_page(make_nes, run, op_code, operand, a, pc):
+    # An instruction at $FFFF reads its operand from $0000 on, outside the
+    # cached code region.
+    nes = make_nes({})
+    bank = bytearray(0x4000)
+    bank[0x3FFF] = op_code
+    nes.mmu.map_memory(0xC0, 0x40, bank, writable=False)
+    nes.ram[0:len(operand)] = bytes(operand)
+    nes.ram[0x10] = 0x99
+    nes.cpu._pc = 0xFFFF
+    if (run):
+        nes.run(instructions=1)
+    else:
+        nes.step()
+    assert nes.cpu._a == a
+    assert nes.cpu._pc == pc
@@ -0,0 +1,69 @@
+import random
+import pytest
+from conftest import snapshot
+from cpu import CPU
+
+# Polling loops are fast-forwarded to the next event by CPU._skip_idle_loop,
+# which has to end up where stepping through them does.
+
+# Waits for VBlank polling PPUSTATUS, counting frames in X.
+VBLANK_LOOP = {
+    0xC000: [0x2C, 0x02, 0x20, # BIT $2002
+             0x10, 0xFB,       # BPL C000
+             0xE8,             # INX
+             0x4C, 0x00, 0xC0] # JMP C000
+}
+
+# Reads PPUDATA until it reads zero, every read moving the VRAM address.
+PPUDATA_LOOP = {
+    0xC000: [0xAD, 0x07, 0x20, # LDA $2007
+             0xD0, 0xFB,       # BNE C000
+             0x4C, 0x00, 0xC0] # JMP C000
+}
+
+@pytest.fixture
+def skipped(monkeypatch):
+    # The instructions skipped by each call to CPU._skip_idle_loop.
+    calls = []
+    skip_idle_loop = CPU._skip_idle_loop
+    def record(cpu, block, cycles, budget):
+        calls.append(skip_idle_loop(cpu, block, cycles, budget))
+        return calls[-1]
+    monkeypatch.setattr(CPU, "_skip_idle_loop", record)
+    return calls
+
+def _run_and_step(make_nes, program, instructions, chr_rom=None):
+    running = make_nes(program, chr_rom=chr_rom)
+    stepping = make_nes(program, chr_rom=chr_rom)
+    chunks = random.Random(2)
+    done = 0
+    while (done < instructions):
+        count = chunks.randint(1, 20000)
+        running.run(instructions=count)
+        for i in range(count):
+            stepping.step()
+        done += count
+        assert snapshot(running) == snapshot(stepping), f"after {done} instructions"
+    return running, done
+
+def test_vblank_loop_is_skipped(make_nes, skipped):
+    nes, instructions = _run_and_step(make_nes, VBLANK_LOOP, 100000)
+    assert nes.cpu._x >= 10
+    assert sum(skipped) > instructions*0.9
+
+def test_vblank_loop_is_skipped_for_frame_budgets(make_nes, skipped):
+    running = make_nes(VBLANK_LOOP)
+    stepping = make_nes(VBLANK_LOOP)
+    for frames in (1, 3, 1):
+        result = running.run(frames=frames)
+        for i in range(result.instructions):
+            stepping.step()
+        assert snapshot(running) == snapshot(stepping)
+    assert sum(skipped) > 0
+
+def test_loop_reading_ppudata_is_not_skipped(make_nes, skipped):
+    # Reads of PPUDATA move the VRAM address, so they all have to happen.
+    nes, instructions = _run_and_step(make_nes, PPUDATA_LOOP, 4000, chr_rom=[0xFF]*0x2000)
+    assert len(skipped) > 0
+    assert sum(skipped) == 0
+    assert nes.ppu.v == (instructions + 1)//2
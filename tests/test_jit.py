@@ -0,0 +1,202 @@
+import pytest
+from conftest import snapshot
+from jit import compile_block
+
+# Compiled blocks against the interpreter: running a block compiled has to
+# have the same effect as stepping through as many instructions as it
+# reports running, wherever it exits.
+
+# Flag results around every kind of exit, some read after it and some
+# overwritten before anything reads them.
+FLAGS = {
+    0xC000: [0xA9, 0x50,       # LDA #$50
+             0x69, 0x50,       # ADC #$50
+             0x8D, 0x03, 0x20, # STA $2003
+             0xC9, 0xA0,       # CMP #$A0
+             0xAD, 0x02, 0x20, # LDA $2002
+             0x0A,             # ASL A
+             0x2A,             # ROL A
+             0x8D, 0x04, 0x20, # STA $2004
+             0xE0, 0x00,       # CPX #0
+             0xA9, 0x7F,       # LDA #$7F
+             0x8D, 0x03, 0x20, # STA $2003
+             0xE9, 0x80,       # SBC #$80
+             0x85, 0x10,       # STA $10
+             0x24, 0x10,       # BIT $10
+             0x08,             # PHP
+             0x68,             # PLA
+             0x4C, 0x00, 0xC0] # JMP C000
+}
+
+# OAM DMA stalls the CPU in the middle of the block.
+DMA = {
+    0xC000: [0xA9, 0x02,       # LDA #2
+             0x8D, 0x14, 0x40, # STA $4014
+             0xE8,             # INX
+             0xBD, 0xF0, 0x02, # LDA $02F0,X
+             0x8D, 0x03, 0x20, # STA $2003
+             0xC8,             # INY
+             0x4C, 0x00, 0xC0] # JMP C000
+}
+
+# Indexed reads that cross a page with large enough indexes, ending in a
+# branch back within the page or forward into the next one.
+def _penalties(target):
+    return {
+        0xC0F0: [0xBD, 0xF0, 0x02,                   # LDA $02F0,X
+                 0xB1, 0x10,                         # LDA ($10),Y
+                 0x99, 0xF0, 0x02,                   # STA $02F0,Y
+                 0xE0, 0x20,                         # CPX #$20
+                 0xD0, (target - 0xC0FC)&0xFF]       # BNE target
+    }
+
+# Runs from RAM, writing RAM and then its own operand.
+RAM_CODE = [0xA9, 0xEA,       # LDA #$EA
+            0x8D, 0x00, 0x04, # STA $0400
+            0xE8,             # INX
+            0x48,             # PHA
+            0x8D, 0x01, 0x03, # STA $0301
+            0x4C, 0x00, 0x03] # JMP $0300
+
+def _load(make_nes, program, pc, setup):
+    # Starts out past the PPU's first event, with the next one at VBlank.
+    nes = make_nes(program)
+    nes._clock = 200
+    nes.scheduler.run_due()
+    if (setup is not None):
+        setup(nes)
+    cpu = nes.cpu
+    cpu._pc = pc
+    assert cpu._move_code(pc)
+    return nes, cpu._decode_block(pc)
+
+def _compare(make_nes, program, pc, setup=None, ram_writes=True, event=None):
+    # Runs the block at pc compiled, with an event at `event` if given, and
+    # interpreted. Returns the number of instructions the compiled block
+    # ran and the most cycles it can take.
+    compiled, block = _load(make_nes, program, pc, setup)
+    stepped, block = _load(make_nes, program, pc, setup)
+    function, cycles = compile_block(pc, block[4], ram_writes)
+
+    if (event is not None):
+        compiled.scheduler.schedule(event, lambda: None)
+    count = function(compiled.cpu)
+    start_clock = stepped._clock
+    for i in range(count):
+        stepped.cpu.step()
+    assert snapshot(compiled) == snapshot(stepped), f"exited after {count} instructions"
+    return count, cycles, stepped._clock - start_clock
+
+def _exit_after_every_instruction(make_nes, program, pc, setup=None, ram_writes=True):
+    # Has an event come due after each instruction in turn. Returns the
+    # instruction counts the block exited after.
+    nes, block = _load(make_nes, program, pc, setup)
+    clocks = []
+    for instruction in block[4]:
+        nes.cpu.step()
+        clocks.append(nes._clock)
+    return [_compare(make_nes, program, pc, setup, ram_writes, clock)[0] for clock in clocks]
+
+def test_whole_block_matches_interpreter(make_nes):
+    count, cycles, taken = _compare(make_nes, FLAGS, 0xC000)
+    assert count == 17
+    assert taken == cycles
+
+def test_flags_are_stored_at_every_exit(make_nes):
+    # Exits are after the writes through the MMU and the $2002 read.
+    counts = _exit_after_every_instruction(make_nes, FLAGS, 0xC000)
+    assert counts == [3, 3, 3, 5, 5, 8, 8, 8, 11, 11, 11, 17, 17, 17, 17, 17, 17]
+
+def test_dma_stall_is_picked_up(make_nes):
+    count, cycles, taken = _compare(make_nes, DMA, 0xC000)
+    assert count == 7
+    # Less the page crossing, plus the stall starting on an even cycle.
+    assert taken == cycles - 1 + 513
+
+@pytest.mark.parametrize("odd", (False, True))
+def test_exits_during_dma_stall(make_nes, odd):
+    # The stall takes a cycle more starting on an odd cycle.
+    def setup(nes):
+        nes._clock += odd
+    counts = _exit_after_every_instruction(make_nes, DMA, 0xC000, setup)
+    assert counts == [2, 2, 5, 5, 5, 7, 7]
+
+@pytest.mark.parametrize("target", (0xC0F0, 0xC100))
+@pytest.mark.parametrize("x", (0x00, 0x08, 0x20, 0x30))
+@pytest.mark.parametrize("y", (0x00, 0x20))
+def test_page_crossing_and_branch_penalties(make_nes, target, x, y):
+    def setup(nes):
+        nes.cpu._x = x
+        nes.cpu._y = y
+        nes.ram[0x10:0x12] = bytes([0xF0, 0x02])
+    count, cycles, taken = _compare(make_nes, _penalties(target), 0xC0F0, setup)
+    assert count == 5
+    # 18 cycles, plus a cycle for each read crossing a page, for taking the
+    # branch, and for the branch crossing a page.
+    assert cycles == 18 + 3 + (target == 0xC100)
+    penalties = (x >= 0x10) + (y >= 0x10) + (x != 0x20) + (x != 0x20 and target == 0xC100)
+    assert taken == 18 + penalties
+
+def test_ram_code_writes_through_mmu(make_nes):
+    # Without ram_writes, writing over the block's own code goes through
+    # the watched page and ends the block.
+    def setup(nes):
+        nes.ram[0x300:0x300 + len(RAM_CODE)] = bytes(RAM_CODE)
+    count, cycles, taken = _compare(make_nes, {}, 0x0300, setup, ram_writes=False)
+    assert count == 5
+
+def test_ram_code_exits_after_every_write(make_nes):
+    def setup(nes):
+        nes.ram[0x300:0x300 + len(RAM_CODE)] = bytes(RAM_CODE)
+    counts = _exit_after_every_instruction(make_nes, {}, 0x0300, setup, ram_writes=False)
+    assert counts == [2, 2, 4, 4, 5, 5]
+
+# Stores through a pointer, into $4000 once the pointer is moved there.
+POINTER_STORE = {
+    0xC000: [0xE8,             # INX
+             0xE0, 0x80,       # CPX #$80
+             0x91, 0x10,       # STA ($10),Y
+             0xC8,             # INY
+             0x4C, 0x00, 0xC0] # JMP C000
+}
+
+@pytest.mark.parametrize("code, finished", (
+    ([0xA9, 0x05, 0xC9, 0x01, 0xE8, 0x8D, 0x00, 0x40, 0xC8, 0x4C, 0x00, 0xC0], 3), # STA $4000
+    ([0xA9, 0x05, 0xC9, 0x05, 0xAD, 0x16, 0x40, 0xC8, 0x4C, 0x00, 0xC0], 2)        # LDA $4016
+))
+def test_failing_access_leaves_state_as_stepping(make_nes, code, finished):
+    # The flags of the compare before the failing access are stored too.
+    compiled, block = _load(make_nes, {0xC000: code}, 0xC000, None)
+    stepped, block = _load(make_nes, {0xC000: code}, 0xC000, None)
+    function, cycles = compile_block(0xC000, block[4])
+
+    with pytest.raises(NotImplementedError) as failure:
+        function(compiled.cpu)
+    assert failure.value.instructions == finished
+    for i in range(finished):
+        stepped.cpu.step()
+    with pytest.raises(NotImplementedError):
+        stepped.cpu.step()
+    assert snapshot(compiled) == snapshot(stepped)
+
+def test_hot_block_failing_in_run_reports_instructions(make_nes):
+    running = make_nes(POINTER_STORE)
+    stepping = make_nes(POINTER_STORE)
+    for nes in (running, stepping):
+        nes.ram[0x10:0x12] = bytes([0x00, 0x02])
+    running.run(instructions=1000)
+    for i in range(1000):
+        stepping.step()
+    assert running.cpu._blocks[0xC000][2] # Compiled
+
+    for nes in (running, stepping):
+        nes.ram[0x11] = 0x40
+    with pytest.raises(NotImplementedError) as failure:
+        running.run(instructions=1000)
+    steps = 0
+    with pytest.raises(NotImplementedError):
+        while True:
+            stepping.step()
+            steps += 1
+    assert failure.value.result.instructions == steps == 2
+    assert snapshot(running) == snapshot(stepping)
@@ -0,0 +1,19 @@
+# MMU page table tests.
+
+def test_words_wrap_at_the_end_of_memory(make_nes):
+    nes = make_nes({})
+    bank = bytearray(0x4000)
+    bank[0x3FFF] = 0x12
+    nes.mmu.map_memory(0xC0, 0x40, bank)
+    nes.ram[0x0000] = 0x34
+    assert nes.mmu.read_word(0xFFFF) == 0x3412
+
+    nes.mmu.write_word(0xFFFF, 0xABCD)
+    assert bank[0x3FFF] == 0xCD
+    assert nes.ram[0x0000] == 0xAB
+
+def test_ram_is_mirrored(make_nes):
+    nes = make_nes({})
+    nes.mmu.write_byte(0x1801, 0x5A)
+    assert nes.ram[0x0001] == 0x5A
+    assert [nes.mmu.read_byte(address) for address in (0x0001, 0x0801, 0x1001)] == [0x5A]*3
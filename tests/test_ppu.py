@@ -0,0 +1,210 @@
+import pytest
+from ppu import PPU
+
+# PPU register tests, through the CPU's view of $2000-$2007.
+# More info: http://wiki.nesdev.com/w/index.php/PPU_scrolling
+
+def _write(nes, register, *values):
+    for value in values:
+        nes.mmu.write_byte(register, value)
+
+def _set_address(nes, address):
+    _write(nes, PPU.PPUADDR, address>>8, address&0xFF)
+
+def _read_vram(nes, address, count=1):
+    # PPUDATA reads below the palettes, skipping the stale buffered one.
+    _set_address(nes, address)
+    nes.mmu.read_byte(PPU.PPUDATA)
+    return [nes.mmu.read_byte(PPU.PPUDATA) for i in range(count)]
+
+def _run_lines(nes, lines):
+    # Runs the PPU until it has finished `lines` scanlines since power on,
+    # the pre-render line first.
+    nes._clock = -(-341*lines//3)
+    nes.ppu.catch_up()
+
+def test_scroll_writes(make_nes):
+    nes = make_nes({})
+    ppu = nes.ppu
+    _write(nes, PPU.PPUSCROLL, 0x7D) # Coarse X 15, fine X 5
+    assert (ppu.t, ppu.fine_x, ppu.w) == (0x000F, 5, 1)
+    _write(nes, PPU.PPUSCROLL, 0x5E) # Coarse Y 11, fine Y 6
+    assert (ppu.t, ppu.fine_x, ppu.w) == ((6<<12) | (11<<5) | 15, 5, 0)
+    assert ppu.v == 0
+
+def test_ctrl_write_sets_nametable_in_t(make_nes):
+    nes = make_nes({})
+    _write(nes, PPU.PPUSCROLL, 0x7D, 0x5E)
+    _write(nes, PPU.PPUCTRL, 0x03)
+    assert nes.ppu.t == 0x0C00 | (6<<12) | (11<<5) | 15
+
+def test_address_writes(make_nes):
+    nes = make_nes({})
+    ppu = nes.ppu
+    _write(nes, PPU.PPUADDR, 0x7F) # Bit 14 is dropped
+    assert (ppu.t, ppu.v, ppu.w) == (0x3F00, 0x0000, 1)
+    _write(nes, PPU.PPUADDR, 0x10)
+    assert (ppu.t, ppu.v, ppu.w) == (0x3F10, 0x3F10, 0)
+
+def test_address_and_scroll_share_t(make_nes):
+    # The split scroll sequence: nametable, Y and X into t, then the second
+    # PPUADDR write copies all of t to v.
+    nes = make_nes({})
+    ppu = nes.ppu
+    _write(nes, PPU.PPUADDR, 0x04)   # Nametable 1
+    _write(nes, PPU.PPUSCROLL, 0x5E) # Coarse Y 11, fine Y 6
+    _write(nes, PPU.PPUSCROLL, 0x7D) # Coarse X 15, fine X 5
+    assert ppu.v == 0
+    _write(nes, PPU.PPUADDR, 0x6F)   # Low bits of coarse Y, coarse X
+    assert (ppu.v, ppu.fine_x, ppu.w) == ((6<<12) | 0x0400 | (11<<5) | 15, 5, 0)
+
+def test_status_read_resets_w(make_nes):
+    nes = make_nes({})
+    ppu = nes.ppu
+    _write(nes, PPU.PPUSCROLL, 0x7D)
+    assert ppu.w == 1
+    nes.mmu.read_byte(PPU.PPUSTATUS)
+    assert ppu.w == 0
+    # So the next write is an X scroll again.
+    _write(nes, PPU.PPUSCROLL, 0x08)
+    assert (ppu.t&0x1F, ppu.fine_x, ppu.w) == (1, 0, 1)
+
+def test_data_reads_are_buffered(make_nes):
+    nes = make_nes({})
+    _set_address(nes, 0x2400)
+    _write(nes, PPU.PPUDATA, 0x11, 0x22, 0x33)
+    assert nes.ppu.v == 0x2403
+
+    _set_address(nes, 0x2400)
+    buffered = nes.ppu._read_buffer
+    assert nes.mmu.read_byte(PPU.PPUDATA) == buffered
+    assert [nes.mmu.read_byte(PPU.PPUDATA) for i in range(3)] == [0x11, 0x22, 0x33]
+
+def test_data_increment_of_32(make_nes):
+    nes = make_nes({})
+    _write(nes, PPU.PPUCTRL, 0x04)
+    _set_address(nes, 0x2000)
+    _write(nes, PPU.PPUDATA, 0x11, 0x22)
+    assert nes.ppu.v == 0x2040
+    _write(nes, PPU.PPUCTRL, 0x00)
+    assert _read_vram(nes, 0x2020, 1) == [0x22]
+
+def test_palette_reads_skip_the_buffer(make_nes):
+    nes = make_nes({})
+    _set_address(nes, 0x2F01)
+    _write(nes, PPU.PPUDATA, 0x44)
+    _set_address(nes, 0x3F01)
+    _write(nes, PPU.PPUDATA, 0x2A)
+
+    _set_address(nes, 0x3F01)
+    assert nes.mmu.read_byte(PPU.PPUDATA) == 0x2A
+    # The buffer gets the nametable byte under the palette.
+    assert nes.ppu._read_buffer == 0x44
+
+@pytest.mark.parametrize("mirror, address", ((0x3F10, 0x3F00), (0x3F14, 0x3F04), (0x3F18, 0x3F08), (0x3F1C, 0x3F0C)))
+def test_sprite_palette_mirrors(make_nes, mirror, address):
+    nes = make_nes({})
+    _set_address(nes, mirror)
+    _write(nes, PPU.PPUDATA, 0x15)
+    _set_address(nes, address)
+    assert nes.mmu.read_byte(PPU.PPUDATA) == 0x15
+
+    _set_address(nes, address)
+    _write(nes, PPU.PPUDATA, 0x26)
+    _set_address(nes, mirror)
+    assert nes.mmu.read_byte(PPU.PPUDATA) == 0x26
+
+def test_other_palette_entries_are_not_mirrored(make_nes):
+    nes = make_nes({})
+    _set_address(nes, 0x3F00)
+    _write(nes, PPU.PPUDATA, *range(0x20))
+    palette = []
+    for address in (0x3F00, 0x3F01, 0x3F04, 0x3F10, 0x3F11, 0x3F13):
+        _set_address(nes, address)
+        palette.append(nes.mmu.read_byte(PPU.PPUDATA))
+    assert palette == [0x10, 0x01, 0x14, 0x10, 0x11, 0x13]
+
+def test_palette_entries_are_6_bit(make_nes):
+    nes = make_nes({})
+    _set_address(nes, 0x3F05)
+    _write(nes, PPU.PPUDATA, 0xFF)
+    _set_address(nes, 0x3F05)
+    assert nes.mmu.read_byte(PPU.PPUDATA) == 0x3F
+
+@pytest.mark.parametrize("flags, mirroring, expected", (
+    (0x00, PPU.HORIZONTAL_MIRRORING, [2, 2, 4, 4]),
+    (0x01, PPU.VERTICAL_MIRRORING, [3, 4, 3, 4]),
+    (0x08, PPU.FOUR_SCREEN, [1, 2, 3, 4])
+))
+def test_nametable_mirroring(make_nes, flags, mirroring, expected):
+    # Set from the header's mirroring and four-screen bits.
+    nes = make_nes({}, flags=flags)
+    assert nes.ppu.nametables == mirroring
+    for table in range(4):
+        _set_address(nes, 0x2000 + (table*0x400) + 0x123)
+        _write(nes, PPU.PPUDATA, table + 1)
+    assert [_read_vram(nes, 0x2000 + (table*0x400) + 0x123)[0] for table in range(4)] == expected
+    # $3000-$3EFF mirrors $2000-$2EFF.
+    assert [_read_vram(nes, 0x3000 + (table*0x400) + 0x123)[0] for table in range(3)] == expected[:3]
+
+def _expected_v(t, lines):
+    # v after `lines` visible lines from v = t: Y moves down a line each
+    # time, wrapping into the next nametable down after row 29, or within
+    # the nametable after the attribute rows 30 and 31.
+    fine_y = t>>12
+    coarse_y = (t>>5)&0x1F
+    nametable = (t>>10)&0x03
+    for line in range(lines):
+        fine_y += 1
+        if (fine_y == 8):
+            fine_y = 0
+            coarse_y += 1
+            if (coarse_y == 30):
+                coarse_y = 0
+                nametable ^= 0x02
+            elif (coarse_y == 32):
+                coarse_y = 0
+    return (fine_y<<12) | (nametable<<10) | (coarse_y<<5) | (t&0x1F)
+
+@pytest.mark.parametrize("scroll_y", (0x00, 0x0B, 0xEF, 0xF8))
+def test_v_follows_t_down_the_frame(make_nes, scroll_y):
+    nes = make_nes({})
+    ppu = nes.ppu
+    _set_address(nes, 0x2345) # Something else than t ends up in v
+    _write(nes, PPU.PPUCTRL, 0x01)
+    _write(nes, PPU.PPUSCROLL, 0x7D, scroll_y)
+    _write(nes, PPU.PPUMASK, 0x18)
+    t = ppu.t
+    assert ppu.v == 0x2345
+
+    # The pre-render line copies all of t to v.
+    _run_lines(nes, 1)
+    assert ppu.v == t
+
+    for line in range(1, 240):
+        _run_lines(nes, 1 + line)
+        assert ppu.v == _expected_v(t, line), f"line {line - 1}"
+
+def test_horizontal_scroll_is_reloaded_every_line(make_nes):
+    nes = make_nes({})
+    ppu = nes.ppu
+    _write(nes, PPU.PPUSCROLL, 0x7D, 0x0B)
+    _write(nes, PPU.PPUMASK, 0x18)
+    _run_lines(nes, 11)
+    t = ppu.t
+    assert ppu.v == _expected_v(t, 10)
+
+    # A scroll split: a new X scroll and nametable, the Y scroll only
+    # takes effect next frame.
+    _write(nes, PPU.PPUCTRL, 0x01)
+    _write(nes, PPU.PPUSCROLL, 0x20, 0x90)
+    assert ppu.v == _expected_v(t, 10)
+    _run_lines(nes, 12)
+    assert ppu.v == (_expected_v(t, 11)&0x7BE0) | 0x0404
+
+def test_v_is_left_alone_without_rendering(make_nes):
+    nes = make_nes({})
+    _set_address(nes, 0x2345)
+    _write(nes, PPU.PPUSCROLL, 0x7D, 0x0B)
+    _run_lines(nes, 100)
+    assert nes.ppu.v == 0x2345
@@ -0,0 +1,169 @@
+import random
+import pytest
+from ppu import PPU
+from renderer import BACKENDS, BackgroundLayer, TileCache
+
+# Renderer tests. The backends are checked against each other: drawing the
+# same VRAM, OAM and registers, NumpyScanlineRenderer has to give the
+# framebuffer and sprite 0 hits ScanlineRenderer does.
+
+def _run_lines(nes, lines):
+    # Runs the PPU until it has finished `lines` scanlines since power on,
+    # the pre-render line first.
+    nes._clock = -(-341*lines//3)
+    nes.ppu.catch_up()
+
+def _load(make_nes, backend, seed, ctrl, mask, flags):
+    # Random pattern tables, nametables, attributes, palettes and OAM, with
+    # sprite 0 somewhere it has a chance to hit: by the left edge, where
+    # clipping can stop it, by the right edge, or anywhere.
+    data = random.Random(seed)
+    chr_rom = bytes(data.getrandbits(8) for i in range(0x2000))
+    nes = make_nes({}, chr_rom=chr_rom, flags=flags)
+    nes.ppu.set_renderer(backend)
+    mmu = nes.mmu
+    mmu.write_byte(PPU.PPUADDR, 0x20)
+    mmu.write_byte(PPU.PPUADDR, 0x00)
+    for i in range(0x1000):
+        mmu.write_byte(PPU.PPUDATA, data.getrandbits(8))
+    mmu.write_byte(PPU.PPUADDR, 0x3F)
+    mmu.write_byte(PPU.PPUADDR, 0x00)
+    for i in range(0x20):
+        mmu.write_byte(PPU.PPUDATA, data.getrandbits(6))
+    nes.ppu.oam[:] = bytes(data.getrandbits(8) for i in range(0x100))
+    nes.ppu.oam[0] = data.randrange(20, 200)
+    nes.ppu.oam[3] = (0, 4, 250, data.randrange(8, 240))[seed%4]
+    mmu.write_byte(PPU.PPUCTRL, ctrl)
+    mmu.write_byte(PPU.PPUSCROLL, data.getrandbits(8))
+    mmu.write_byte(PPU.PPUSCROLL, data.randrange(0, 240))
+    mmu.write_byte(PPU.PPUMASK, mask)
+    return nes, data
+
+def _render(make_nes, backend, seed, ctrl, mask, flags):
+    # Draws a frame a line at a time, with a scroll split halfway down, and
+    # then another in one go. Returns both framebuffers and the lines sprite
+    # 0 hit on.
+    nes, data = _load(make_nes, backend, seed, ctrl, mask, flags)
+    hits = []
+    for line in range(240):
+        _run_lines(nes, line + 2)
+        hits.append(bool(nes.ppu.status&0x40))
+        if (line == 120):
+            nes.mmu.write_byte(PPU.PPUCTRL, ctrl ^ 0x01)
+            nes.mmu.write_byte(PPU.PPUSCROLL, data.getrandbits(8))
+            nes.mmu.write_byte(PPU.PPUSCROLL, data.randrange(0, 240))
+    split = bytes(nes.ppu.framebuffer)
+    _run_lines(nes, 262 + 241)
+    return split, bytes(nes.ppu.framebuffer), hits.index(True) if (True in hits) else None
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("ctrl, mask, flags", (
+    (0x00, 0x1E, 0x00), # Background and sprites, nothing clipped
+    (0x18, 0x18, 0x01), # Both clipped, swapped pattern tables
+    (0x20, 0x1A, 0x08), # 8x16 sprites, sprites clipped
+    (0x30, 0x1C, 0x00), # 8x16 sprites, background clipped
+    (0x00, 0x0A, 0x01), # Background only
+    (0x08, 0x14, 0x00), # Sprites only
+    (0x00, 0x00, 0x00)  # Rendering off
+))
+def test_backends_draw_the_same(make_nes, seed, ctrl, mask, flags):
+    pytest.importorskip("numpy")
+    python = _render(make_nes, "python", seed, ctrl, mask, flags)
+    numpy = _render(make_nes, "numpy", seed, ctrl, mask, flags)
+    assert python[0] == numpy[0]
+    assert python[1] == numpy[1]
+    assert python[2] == numpy[2]
+    # Sprite 0 at x=0 can't hit with either side clipped.
+    if (mask&0x18 == 0x18 and (mask&0x06 == 0x06 or seed%4)):
+        assert python[2] is not None
+
+def _write_vram(nes, address, data):
+    # Writes through PPUDATA, then scrolls back to the top left.
+    nes.mmu.write_byte(PPU.PPUADDR, address>>8)
+    nes.mmu.write_byte(PPU.PPUADDR, address&0xFF)
+    for byte in data:
+        nes.mmu.write_byte(PPU.PPUDATA, byte)
+    nes.mmu.write_byte(PPU.PPUSCROLL, 0x00)
+    nes.mmu.write_byte(PPU.PPUSCROLL, 0x00)
+
+def _tile_frame(low):
+    # A screen of tile 1 with low plane row `low` in background palette
+    # colour 1, and sprite 0 showing tile 1 in sprite palette colour 1 at
+    # (100, 51).
+    frame = bytearray()
+    for line in range(240):
+        for x in range(256):
+            if (51 <= line < 59 and 100 <= x < 108 and low&(0x80>>(x - 100))):
+                frame.append(0x16)
+            else:
+                frame.append(0x21 if (low&(0x80>>(x&0x07))) else 0x0F)
+    return bytes(frame)
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_chr_ram_writes_redraw_the_tile(make_nes, backend):
+    nes = make_nes({}, chr_rom=b"")
+    nes.ppu.set_renderer(backend)
+    _write_vram(nes, 0x2000, [0x01]*0x3C0 + [0x00]*0x40)
+    _write_vram(nes, 0x3F00, [0x0F, 0x21, 0x00, 0x00] + [0x00]*12 + [0x0F, 0x16])
+    nes.ppu.oam[0:4] = bytes([50, 0x01, 0x00, 100])
+    nes.mmu.write_byte(PPU.PPUMASK, 0x1E)
+
+    frames = 0
+    for low in (0x00, 0xF0, 0x3C):
+        # Written in VBlank, the next frame has to show it.
+        _write_vram(nes, 0x0010, [low]*8)
+        frames += 1
+        _run_lines(nes, 262*frames + 241)
+        assert bytes(nes.ppu.framebuffer) == _tile_frame(low), f"low plane {low:02X}"
+
+def test_tile_cache_keeps_the_last_4_banks():
+    tiles = TileCache()
+    # Every row of bank b has pixel 7-b set to 3 and the rest clear.
+    banks = [bytearray([1<<bank])*0x2000 for bank in range(6)]
+    for bank in banks[0:4]:
+        tiles.select(bank)
+        tiles.row(0x0000)
+    tiles.select(banks[0])
+    assert tiles.rows[0x0000] == bytes([0, 0, 0, 0, 0, 0, 0, 3])
+
+    # Mapping two more drops banks 1 and 2, the least recently mapped.
+    for bank in banks[4:6]:
+        tiles.select(bank)
+        tiles.row(0x0000)
+    # Kept ones first, mapping a dropped one drops another.
+    for bank, decoded in ((0, True), (3, True), (4, True), (5, True), (2, False), (1, False)):
+        tiles.select(banks[bank])
+        assert (tiles.rows[0x0000] is not None) == decoded, f"bank {bank}"
+        assert tiles.row(0x0000).index(3) == 7 - bank
+
+def _redrawn(nes, table):
+    # The background layer drawn from scratch.
+    layer = BackgroundLayer(nes.ppu)
+    layer.update(table, range(4))
+    return layer.pixels
+
+@pytest.mark.parametrize("table", (0x0000, 0x1000))
+@pytest.mark.parametrize("address, data", (
+    (0x2000, [0x00]),             # Name bytes, in each nametable
+    (0x25DF, [0x42, 0x43]),
+    (0x2BBF, [0x80]),
+    (0x2FBF, [0xFF]),
+    (0x23C0, [0x55]),             # Attribute bytes, the top left one
+    (0x27C9, [0xE4]),
+    (0x2BF8, [0x1B, 0x00]),       # The last row, covering only 2 rows of cells
+    (0x2FFF, [0xAA]),
+    (0x0420, [0xFF]*3),           # Pattern bytes, in both tables
+    (0x1FF8, [0x81]*8),
+    (0x1000, [0x00]*16)
+))
+def test_background_changes_match_a_full_redraw(make_nes, table, address, data):
+    nes = make_nes({}, chr_rom=b"", flags=0x08)
+    ppu = nes.ppu
+    random_data = random.Random(address)
+    _write_vram(nes, 0x0000, [random_data.getrandbits(8) for i in range(0x2000)])
+    _write_vram(nes, 0x2000, [random_data.getrandbits(8) for i in range(0x1000)])
+    ppu.background.update(table, range(4))
+
+    _write_vram(nes, address, data)
+    ppu.background.update(table, range(4))
+    assert ppu.background.pixels == _redrawn(nes, table)
@@ -0,0 +1,149 @@
+import os
+import pytest
+import tracetool
+from tracer import MAGIC, RECORD, BinarySink, MemorySink, NestestSink, Tracer, read_binary_trace, read_nestest_trace, read_trace
+
+# Trace sinks and readers, and tracetool's convert and diff commands, on
+# the reference nestest.log.
+
+NESTEST_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "roms", "nestest.log.txt")
+
+# Counts down X and Y in a loop, storing them.
+LOOP = {
+    0xC000: [0xCA,             # DEX
+             0x86, 0x10,       # STX $10
+             0xD0, 0xFB,       # BNE C000
+             0x88,             # DEY
+             0x84, 0x11,       # STY $11
+             0x4C, 0x00, 0xC0] # JMP C000
+}
+
+@pytest.fixture(scope="module")
+def nestest():
+    return list(read_nestest_trace(NESTEST_LOG))
+
+def _write_binary(path, records):
+    sink = BinarySink(str(path))
+    sink.write(records)
+    sink.close()
+    return str(path)
+
+def _trace(make_nes, sink, instructions, **options):
+    nes = make_nes(LOOP)
+    tracer = Tracer(sink, **options)
+    nes.cpu.set_tracer(tracer)
+    nes.run(instructions=instructions)
+    tracer.close()
+
+def test_sinks_write_what_the_cpu_ran(make_nes, tmp_path):
+    memory = MemorySink()
+    _trace(make_nes, memory, 3000)
+    assert len(memory.records) == 3000
+    assert memory.records[0][0:2] == (0xC000, 0xCA)
+
+    _trace(make_nes, BinarySink(str(tmp_path / "run.trc")), 3000, batch=7)
+    assert list(read_binary_trace(str(tmp_path / "run.trc"))) == memory.records
+    _trace(make_nes, NestestSink(str(tmp_path / "run.log.gz")), 3000)
+    assert list(read_nestest_trace(str(tmp_path / "run.log.gz"), memory.records[0][9])) == memory.records
+
+    # A ring keeps the last records only.
+    _trace(make_nes, BinarySink(str(tmp_path / "ring.trc.xz")), 3000, ring=100)
+    assert list(read_binary_trace(str(tmp_path / "ring.trc.xz"))) == memory.records[-100:]
+
+def test_nestest_log_is_read(nestest):
+    assert len(nestest) == 8991
+    assert nestest[0] == (0xC000, 0x4C, 0xF5, 0xC5, 0x00, 0x00, 0x00, 0x24, 0xFD, 0)
+    assert nestest[1] == (0xC5F5, 0xA2, 0x00, 0x00, 0x00, 0x00, 0x00, 0x24, 0xFD, 3)
+    # The dot wraps every scanline, the cycle keeps counting.
+    assert [record[9] for record in nestest] == sorted(record[9] for record in nestest)
+    assert nestest[-1][9] > 341*3
+
+@pytest.mark.parametrize("destination", ("nestest.trc", "nestest.trc.gz", "nestest.trc.xz"))
+def test_convert(nestest, tmp_path, capsys, destination):
+    destination = str(tmp_path / destination)
+    assert tracetool.main(["convert", NESTEST_LOG, destination]) == 0
+    assert "8991 records written" in capsys.readouterr().out
+    assert list(read_trace(destination)) == nestest
+
+    # And back, converting a binary trace copies it.
+    copy = str(tmp_path / "copy.trc")
+    tracetool.main(["convert", destination, copy])
+    with open(copy, "rb") as file:
+        data = file.read()
+    assert data[:len(MAGIC)] == MAGIC
+    assert len(data) == len(MAGIC) + 8991*RECORD.size
+    assert list(read_binary_trace(copy)) == nestest
+
+def test_partial_record_at_the_end_is_dropped(nestest, tmp_path):
+    path = _write_binary(tmp_path / "cut.trc", nestest[:10])
+    with open(path, "r+b") as file:
+        file.truncate(len(MAGIC) + 9*RECORD.size + 5)
+    assert list(read_binary_trace(path)) == nestest[:9]
+
+def test_identical_traces_match(nestest, tmp_path, capsys):
+    binary = _write_binary(tmp_path / "nestest.trc", nestest)
+    assert tracetool._first_raw_difference(binary, binary) is None
+    assert tracetool.diff_traces(binary, binary) is None
+    assert tracetool.diff_traces(NESTEST_LOG, binary) is None
+    assert tracetool.main(["diff", NESTEST_LOG, binary]) == 0
+    assert "Traces match" in capsys.readouterr().out
+
+# Indexes in the first chunk, at the start of the second and in the last.
+@pytest.mark.parametrize("index", (0, 3, 4096, 8990))
+def test_diff_finds_a_changed_record(nestest, tmp_path, capsys, index):
+    expected = _write_binary(tmp_path / "expected.trc", nestest)
+    records = list(nestest)
+    records[index] = records[index][:4] + ((records[index][4] + 1)&0xFF,) + records[index][5:]
+    actual = _write_binary(tmp_path / "actual.trc", records)
+
+    assert tracetool._first_raw_difference(expected, actual) == index
+    for source in (expected, NESTEST_LOG):
+        divergence = tracetool.diff_traces(source, actual, context=3)
+        assert divergence.index == index
+        assert divergence.expected == nestest[index]
+        assert divergence.actual == records[index]
+        assert divergence.fields == ["A"]
+        assert divergence.context == nestest[max(0, index - 3):index]
+
+    assert tracetool.main(["diff", NESTEST_LOG, actual]) == 1
+    out = capsys.readouterr().out
+    assert f"First divergence at record {index} (line {index + 1})" in out
+    assert f"Fields (expected/actual): A ${nestest[index][4]:02X}/${records[index][4]:02X}" in out
+
+# Cut in the first chunk, and right at the end of it.
+@pytest.mark.parametrize("length", (100, 4096))
+def test_diff_finds_the_end_of_a_shorter_trace(nestest, tmp_path, capsys, length):
+    full = _write_binary(tmp_path / "full.trc", nestest)
+    short = _write_binary(tmp_path / "short.trc", nestest[:length])
+
+    assert tracetool._first_raw_difference(full, short) == length
+    assert tracetool._first_raw_difference(short, full) == length
+    divergence = tracetool.diff_traces(full, short)
+    assert (divergence.index, divergence.expected, divergence.actual) == (length, nestest[length], None)
+    assert divergence.fields == []
+    divergence = tracetool.diff_traces(short, NESTEST_LOG)
+    assert (divergence.index, divergence.expected, divergence.actual) == (length, None, nestest[length])
+
+    assert tracetool.main(["diff", NESTEST_LOG, short]) == 1
+    out = capsys.readouterr().out
+    assert "  + <end of trace>" in out
+    assert "Fields" not in out
+
+def test_diff_ignores_fields(nestest, tmp_path, capsys):
+    # Every cycle off by one, and one stack pointer changed further on.
+    records = [record[:9] + (record[9] + 1,) for record in nestest]
+    actual = _write_binary(tmp_path / "actual.trc", records)
+    divergence = tracetool.diff_traces(NESTEST_LOG, actual)
+    assert (divergence.index, divergence.fields) == (0, ["CYC"])
+    assert tracetool.diff_traces(NESTEST_LOG, actual, ignore=("CYC",)) is None
+    assert tracetool.main(["diff", NESTEST_LOG, actual, "--ignore", "CYC"]) == 0
+    capsys.readouterr()
+
+    records[5000] = records[5000][:8] + (0x00,) + records[5000][9:]
+    actual = _write_binary(tmp_path / "actual.trc", records)
+    divergence = tracetool.diff_traces(NESTEST_LOG, actual, ignore=("CYC",))
+    assert (divergence.index, divergence.fields) == (5000, ["SP", "CYC"])
+    assert tracetool.diff_traces(NESTEST_LOG, actual, ignore=("SP", "CYC")) is None
+    assert tracetool.main(["diff", NESTEST_LOG, actual, "--ignore", "SP", "--ignore", "CYC"]) == 0
+    assert tracetool.main(["diff", NESTEST_LOG, actual, "--ignore", "CYC"]) == 1
+    assert "Fields (expected/actual): SP $" in capsys.readouterr().out